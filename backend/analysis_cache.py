@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_DIR = os.getenv('ANALYSIS_CACHE_DIR', 'analysis_cache')
+MEMORY_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', '256'))
+MAX_DISK_BYTES = int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+
+def pdf_key(data: bytes) -> str:
+    """Key for an uploaded PDF's extracted text and page counts"""
+    return 'pdf-v2-' + hashlib.sha256(data).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-extractions with different spacing share a key"""
+    return ' '.join(text.split())
+
+
+def text_key(text: str, prompt_version: str) -> str:
+    """Key for the analysis of a report's text under a given prompt"""
+    digest = hashlib.sha256(normalize_text(text).encode())
+    digest.update(b'\0' + prompt_version.encode())
+    return 'text-' + digest.hexdigest()
+
+
+class AnalysisCache:
+    """Two-tier cache of report extractions and validated LLM analyses.
+
+    A bounded in-memory LRU sits in front of a directory of JSON files. The
+    disk tier survives restarts and is shared by workers; when it grows past
+    max_disk_bytes the least recently used files are evicted. Entries are
+    JSON-serialisable dicts.
+    """
+
+    def __init__(self, directory: str = ANALYSIS_CACHE_DIR, memory_entries: int = MEMORY_ENTRIES,
+                 max_disk_bytes: int = MAX_DISK_BYTES):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return entry
+
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            # Reads refresh the mtime that disk eviction orders by
+            os.utime(path)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits['disk'] += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._remember(key, entry)
+        try:
+            self._write(key, entry)
+        except OSError as e:
+            logger.warning(f"Could not persist analysis cache entry {key}: {str(e)}")
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _write(self, key: str, entry: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += size - previous
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._evict()
+
+    def _scan_disk_bytes(self) -> int:
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                total += entry.stat().st_size
+        return total
+
+    def _evict(self) -> None:
+        """Delete least recently used files until the disk tier is at 90% of its limit"""
+        files = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in files)
+        target = self.max_disk_bytes * 0.9
+        for entry in files:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                continue
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.hits['memory'] + self.hits['disk']
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.hits['memory'],
+                'disk_hits': self.hits['disk'],
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_bytes': self._disk_bytes
+            }
@@ -0,0 +1,418 @@
+"""Reproducible performance benchmarks for the backend.
+
+Generates synthetic patient datasets in the output.json schema, ingests them
+through the Excel pipeline, trains the models, times single and batch
+prediction, and measures /upload throughput against a local stand-in for the
+clewd proxy. Results are written as JSON so runs can be diffed across versions:
+
+    python benchmark.py run --sizes 1000,100000,1000000 --output benchmark_results.json
+    python benchmark.py generate 1000 --output synthetic.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+from openpyxl import Workbook
+from data_cleaner import ingest_excel
+from estimators import DISEASE_MODEL, MEDICINE_MODEL, TRAINING_N_JOBS
+from model_registry import ModelRegistry
+from record_store import RecordStore
+
+BENCHMARK_VERSION = 1
+COLUMNS = ('Name', 'DateOfBirth', 'Gender', 'Symptoms', 'Causes', 'Disease', 'Medicine')
+
+# Size of the synthetic vocabulary; each disease has its own symptom, cause and medicine profile
+N_DISEASES = 40
+N_SYMPTOMS = 120
+N_CAUSES = 25
+N_MEDICINES = 60
+
+STUB_ANALYSIS = {
+    'summary': 'Synthetic summary of the report.',
+    'findings': [{'emoji': '🩺', 'text': 'Haemoglobin is within the normal range'}],
+    'terms': [{'term': 'Haemoglobin', 'explanation': 'The protein in red blood cells that carries oxygen'}],
+    'recommendations': [{'emoji': '💧', 'title': 'Stay hydrated', 'description': 'Drink enough water'}]
+}
+
+
+def _profiles(rng: random.Random) -> List[Dict[str, List[str]]]:
+    symptoms = [f"Symptom {i}" for i in range(N_SYMPTOMS)]
+    causes = [f"Cause {i}" for i in range(N_CAUSES)]
+    medicines = [f"Medicine {i}" for i in range(N_MEDICINES)]
+    return [{
+        'disease': f"Disease {i}",
+        'symptoms': rng.sample(symptoms, 5),
+        'causes': rng.sample(causes, 2),
+        'medicines': rng.sample(medicines, 3)
+    } for i in range(N_DISEASES)]
+
+
+def generate_records(n: int, seed: int = 42) -> Iterator[Dict[str, str]]:
+    """Yield n synthetic patient records; the same seed gives the same records"""
+    rng = random.Random(seed)
+    profiles = _profiles(random.Random(seed))
+    noise = [f"Symptom {i}" for i in range(N_SYMPTOMS)]
+    for i in range(n):
+        profile = rng.choice(profiles)
+        cause = rng.choice(profile['causes'])
+        symptoms = rng.sample(profile['symptoms'], rng.randint(2, 4))
+        if rng.random() < 0.2:
+            symptoms.append(rng.choice(noise))
+        yield {
+            'Name': f"Patient {i}",
+            'DateOfBirth': f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-{rng.randint(1940, 2020)}",
+            'Gender': rng.choice(('Male', 'Female')),
+            'Symptoms': ', '.join(symptoms),
+            'Causes': cause,
+            'Disease': profile['disease'],
+            # The first medicine always applies, the others depend on the cause
+            'Medicine': ', '.join(profile['medicines'][:2] if cause == profile['causes'][0]
+                                  else profile['medicines'][::2])
+        }
+
+
+def generate_patients(n: int, seed: int) -> List[Dict[str, Any]]:
+    """Prediction inputs drawn from the same distribution as the training records"""
+    rng = random.Random(seed)
+    return [{
+        'age': rng.randint(1, 90),
+        'gender': record['Gender'][0],
+        'symptoms': record['Symptoms'],
+        'cause': record['Causes']
+    } for record in generate_records(n, seed)]
+
+
+def write_json(records: Iterator[Dict[str, str]], path: str) -> None:
+    """Stream records to path as a JSON list, like output.json"""
+    with open(path, 'w') as f:
+        f.write('[')
+        for i, record in enumerate(records):
+            f.write(',\n' if i else '\n')
+            f.write(json.dumps(record))
+        f.write('\n]\n')
+
+
+def write_excel(records: Iterator[Dict[str, str]], path: str) -> None:
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(COLUMNS)
+    for record in records:
+        sheet.append([record[column] for column in COLUMNS])
+    workbook.save(path)
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Minimal uncompressed PDF with one Helvetica text page per string"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = ' '.join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    font = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        lines = ' '.join(f"({line}) '" for line in text.split('\n'))
+        stream = f"BT /F1 11 Tf 50 750 Td 14 TL {lines} ET".encode()
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 {font} 0 R >> >> >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b''.join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def synthetic_report(index: int, n_pages: int) -> bytes:
+    """A distinct n_pages lab report, so every upload misses the caches"""
+    return make_pdf([
+        f"LABORATORY REPORT {index} page {page}\n" + '\n'.join(
+            f"Test {line}: Haemoglobin {12 + (index + line) % 4}.{line % 10} g/dL, WBC {5000 + 37 * index + line}"
+            for line in range(40))
+        for page in range(n_pages)
+    ])
+
+
+class StubLLMServer:
+    """OpenAI-compatible chat completions server standing in for the clewd proxy.
+
+    Every request sleeps for delay seconds and answers with the same valid
+    analysis, streamed as server-sent events when the request asks for it.
+    """
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.delay)
+                content = 'Here is the analysis:\n' + json.dumps(STUB_ANALYSIS)
+                if body.get('stream'):
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.end_headers()
+                    for start in range(0, len(content), 40):
+                        delta = {'choices': [{'delta': {'content': content[start:start + 40]}}]}
+                        self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode())
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    return
+                payload = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': content}}]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}/v1/chat/completions"
+
+    def __enter__(self) -> 'StubLLMServer':
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """Summary of latencies given in seconds, reported in milliseconds"""
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(percentile(0.50) * 1000, 3),
+        'p95_ms': round(percentile(0.95) * 1000, 3),
+        'p99_ms': round(percentile(0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def bench_dataset(rows: int, work_dir: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Ingest, train and predict on a synthetic dataset of the given size"""
+    directory = os.path.join(work_dir, f"rows-{rows}")
+    os.makedirs(directory)
+    excel_path = os.path.join(directory, 'records.xlsx')
+
+    started = time.perf_counter()
+    write_excel(generate_records(rows, args.seed), excel_path)
+    generate_seconds = time.perf_counter() - started
+
+    store = RecordStore(os.path.join(directory, 'records.db'), seed_json='')
+    ingest = ingest_excel(excel_path, store)
+
+    # No artifact directory, so every run fits from scratch
+    registry = ModelRegistry(store, artifact_dir=None, dataset_dir=os.path.join(directory, 'dataset'),
+                             evaluate=False)
+    started = time.perf_counter()
+    registry.dataset_cache.refresh()
+    compile_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    snapshot = registry.load()
+    train_seconds = time.perf_counter() - started
+
+    patients = generate_patients(max(args.single_iterations, args.batch_size), args.seed + 1)
+    for patient in patients[:10]:
+        snapshot.predict_batch([patient])
+    single = []
+    for patient in patients[:args.single_iterations]:
+        started = time.perf_counter()
+        snapshot.predict_batch([patient])
+        single.append(time.perf_counter() - started)
+
+    batch = patients[:args.batch_size]
+    batches = []
+    for _ in range(args.batch_repeats):
+        started = time.perf_counter()
+        snapshot.predict_batch(batch)
+        batches.append(time.perf_counter() - started)
+
+    accuracies = snapshot.core.get_model_accuracies()
+    return {
+        'rows': rows,
+        'generate_seconds': round(generate_seconds, 3),
+        'ingest': ingest,
+        'training': {
+            'compile_seconds': round(compile_seconds, 3),
+            'train_seconds': round(train_seconds, 3),
+            'model_version': snapshot.model_version,
+            **accuracies
+        },
+        'predict_single': latency_stats(single),
+        'predict_batch': {
+            'batch_size': len(batch),
+            **latency_stats(batches),
+            'rows_per_second': round(len(batch) / statistics.median(batches), 1)
+        }
+    }
+
+
+async def _upload_round(client, reports: List[bytes], concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def upload(index: int, data: bytes) -> None:
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post('/upload', files={
+                'file_upload': (f"benchmark-{index}.pdf", data, 'application/pdf')
+            })
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(i, data) for i, data in enumerate(reports)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(reports),
+        'failures': failures,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(reports) / elapsed, 2),
+        **latency_stats(latencies)
+    }
+
+
+async def _bench_upload(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    # main reads LLM_URL and the cache directories when it is imported
+    import main
+
+    nonce = int(time.time())
+    reports = [synthetic_report(nonce * 1000 + i, args.pdf_pages) for i in range(args.upload_requests + 1)]
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+            # Start the extraction workers before timing anything
+            await _upload_round(client, reports[-1:], 1)
+            reports = reports[:-1]
+            # First round extracts and analyses every report; the second is served from the caches
+            cold = await _upload_round(client, reports, args.upload_concurrency)
+            warm = await _upload_round(client, reports, args.upload_concurrency)
+    finally:
+        main.pdf_extractor.shutdown()
+        await main.llm_client.aclose()
+    return {'pdf_pages': args.pdf_pages, 'concurrency': args.upload_concurrency, 'cold': cold, 'warm': warm}
+
+
+def bench_upload(args: argparse.Namespace, work_dir: str) -> Dict[str, Any]:
+    directory = os.path.join(work_dir, 'upload')
+    os.makedirs(directory)
+    cwd = os.getcwd()
+    with StubLLMServer(args.llm_delay) as stub:
+        os.environ['LLM_URL'] = stub.url
+        os.environ['ANALYSIS_CACHE_DIR'] = os.path.join(directory, 'analysis_cache')
+        # Uploaded files are saved relative to the working directory
+        os.chdir(directory)
+        try:
+            result = asyncio.run(_bench_upload(args))
+        finally:
+            os.chdir(cwd)
+        result['llm_delay_seconds'] = args.llm_delay
+        result['llm_requests'] = stub.requests
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    results = {
+        'benchmark_version': BENCHMARK_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'seed': args.seed,
+            'disease_model': DISEASE_MODEL,
+            'medicine_model': MEDICINE_MODEL,
+            'training_n_jobs': TRAINING_N_JOBS
+        },
+        'datasets': [],
+        'upload': None
+    }
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as work_dir:
+        for rows in args.sizes:
+            print(f"Benchmarking {rows} rows...", file=sys.stderr)
+            results['datasets'].append(bench_dataset(rows, work_dir, args))
+        if args.upload_requests:
+            print(f"Benchmarking {args.upload_requests} uploads...", file=sys.stderr)
+            results['upload'] = bench_upload(args, work_dir)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks and write the results as JSON')
+    run_parser.add_argument('--sizes', default='1000,100000,1000000',
+                            type=lambda value: [int(size) for size in value.split(',') if size],
+                            help='comma-separated dataset sizes in rows')
+    run_parser.add_argument('--output', default='benchmark_results.json')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--single-iterations', type=int, default=200)
+    run_parser.add_argument('--batch-size', type=int, default=1000)
+    run_parser.add_argument('--batch-repeats', type=int, default=5)
+    run_parser.add_argument('--upload-requests', type=int, default=20, help='0 skips the /upload benchmark')
+    run_parser.add_argument('--upload-concurrency', type=int, default=4)
+    run_parser.add_argument('--pdf-pages', type=int, default=5)
+    run_parser.add_argument('--llm-delay', type=float, default=0.05, help='stub LLM response time in seconds')
+
+    generate_parser = commands.add_parser('generate', help='write a synthetic dataset in the output.json schema')
+    generate_parser.add_argument('rows', type=int)
+    generate_parser.add_argument('--output', default='synthetic.json')
+    generate_parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        write_json(generate_records(args.rows, args.seed), args.output)
+        return
+
+    results = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from model_artifacts import chain_digest
+from record_store import RecordStore
+
+if TYPE_CHECKING:
+    import scipy.sparse as sp
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; one worker per cache there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DATASET_DIR = os.getenv('DATASET_CACHE_DIR', 'dataset_cache')
+FORMAT_VERSION = 1
+
+# Column files: name -> dtype. Per-row columns hold one value per record;
+# the *_indices columns hold the concatenated label ids of every record.
+COLUMNS = {
+    'record_ids': np.int64,
+    'ages': np.int64,
+    'genders': np.int8,
+    'cause_ids': np.int32,
+    'disease_ids': np.int32,
+    'symptom_counts': np.int32,
+    'symptom_indices': np.int32,
+    'medicine_counts': np.int32,
+    'medicine_indices': np.int32,
+}
+VOCABULARIES = ('symptoms', 'causes', 'diseases', 'medicines')
+
+
+def safe_split(value) -> List[str]:
+    """Safely split a string, handling None and empty values"""
+    if not value:
+        return []
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def clean_record(record: Dict) -> Optional[Dict]:
+    """Clean one raw record the way the predictors do, or None to skip it"""
+    try:
+        cleaned_record = {
+            'Age': int(record.get('Age', 0)),
+            'Gender': str(record.get('Gender', '')).strip().upper(),
+            'Symptoms': str(record.get('Symptoms', '')),
+            'Causes': str(record.get('Causes', '')),
+            'Disease': str(record.get('Disease', '')),
+            'Medicine': str(record.get('Medicine', ''))
+        }
+    except Exception:
+        return None
+    if cleaned_record['Disease'] and cleaned_record['Symptoms']:
+        return cleaned_record
+    return None
+
+
+def _ranks(vocabulary: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted classes and the sorted position of each vocabulary id.
+
+    The cache numbers labels in the order they were first seen, while the
+    sklearn encoders order classes alphabetically.
+    """
+    labels = np.array(vocabulary, dtype=object)
+    order = np.argsort(labels.astype(str), kind='stable')
+    ranks = np.empty(len(labels), dtype=np.int32)
+    ranks[order] = np.arange(len(labels), dtype=np.int32)
+    return labels[order], ranks
+
+
+class CompiledDataset:
+    """Read-only, memory-mapped view of the cleaned and encoded training data"""
+
+    def __init__(self, directory: str, meta: Dict):
+        self.directory = directory
+        self.n_rows = meta['n_rows']
+        self.last_record_id = meta['last_record_id']
+        self.data_digest = bytes.fromhex(meta['data_digest'])
+        self.vocab: Dict[str, List[str]] = meta['vocab']
+        lengths = {
+            'symptom_indices': meta['symptom_nnz'],
+            'medicine_indices': meta['medicine_nnz'],
+        }
+        for name, dtype in COLUMNS.items():
+            length = lengths.get(name, self.n_rows)
+            if length:
+                column = np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype,
+                                   mode='r', shape=(length,))
+            else:
+                column = np.empty(0, dtype=dtype)
+            setattr(self, name, column)
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def label_counts(self, name: str) -> Dict[str, int]:
+        """How often each symptom or cause label occurs in the dataset"""
+        ids = {'symptoms': self.symptom_indices, 'causes': self.cause_ids}[name]
+        counts = np.bincount(ids, minlength=len(self.vocab[name]))
+        return dict(zip(self.vocab[name], counts.tolist()))
+
+    def _label_matrix(self, counts: np.ndarray, indices: np.ndarray, ranks: np.ndarray) -> 'sp.csr_matrix':
+        import scipy.sparse as sp
+
+        indptr = np.zeros(self.n_rows + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        matrix = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.int64), ranks[indices], indptr),
+            shape=(self.n_rows, len(ranks))
+        )
+        # A label repeated within one record still encodes as a single 1
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    def features_and_targets(self, symptom_encoder, cause_encoder, disease_encoder,
+                             medicine_encoder):
+        """Fit the encoders from the cached vocabularies and build X and y.
+
+        Gives the same matrices as fitting the encoders on the cleaned records,
+        without materialising those records as Python objects.
+        """
+        # scipy and sklearn are only loaded once something is trained
+        import scipy.sparse as sp
+        from features import assemble_features
+
+        symptom_classes, symptom_ranks = _ranks(self.vocab['symptoms'])
+        cause_classes, cause_ranks = _ranks(self.vocab['causes'])
+        disease_classes, disease_ranks = _ranks(self.vocab['diseases'])
+        medicine_classes, medicine_ranks = _ranks(self.vocab['medicines'])
+
+        symptom_encoder.fit([symptom_classes.tolist()])
+        cause_encoder.fit(cause_classes.reshape(-1, 1))
+        disease_encoder.fit(disease_classes)
+        medicine_encoder.fit([medicine_classes.tolist()])
+
+        X_symptoms = self._label_matrix(self.symptom_counts, self.symptom_indices, symptom_ranks)
+        X_causes = sp.csr_matrix(
+            (np.ones(self.n_rows), cause_ranks[self.cause_ids], np.arange(self.n_rows + 1)),
+            shape=(self.n_rows, len(cause_classes))
+        )
+        X = assemble_features(self.ages, self.genders, X_symptoms, X_causes)
+
+        y_diseases = disease_ranks[self.disease_ids].astype(np.int64)
+        y_medicines = self._label_matrix(
+            self.medicine_counts, self.medicine_indices, medicine_ranks
+        ).toarray()
+        return X, y_diseases, y_medicines
+
+
+class DatasetCache:
+    """Incrementally compiled columnar copy of the record store.
+
+    Cleaned fields are encoded to integer ids and appended to flat binary
+    column files that training memory-maps. refresh() only processes records
+    added since the last refresh; meta.json is replaced last, so a crash
+    mid-refresh leaves the previous dataset intact and the partial tail is
+    truncated on the next run.
+    """
+
+    def __init__(self, store: RecordStore, directory: str = DATASET_DIR):
+        self.store = store
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, 'meta.json')
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(self._meta_path(), 'r') as f:
+                meta = json.load(f)
+            if meta.get('format') == FORMAT_VERSION:
+                return meta
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return self._empty_meta()
+
+    @staticmethod
+    def _empty_meta() -> Dict:
+        return {
+            'format': FORMAT_VERSION,
+            'n_rows': 0,
+            'last_record_id': 0,
+            'symptom_nnz': 0,
+            'medicine_nnz': 0,
+            'data_digest': '',
+            'vocab': {name: [] for name in VOCABULARIES}
+        }
+
+    def _write_meta(self, meta: Dict) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._meta_path())
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialise refreshes across threads and processes sharing the directory"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self) -> CompiledDataset:
+        """Open the dataset as of the last refresh"""
+        return CompiledDataset(self.directory, self._read_meta())
+
+    def refresh(self) -> CompiledDataset:
+        """Compile records added to the store since the last refresh"""
+        with self._exclusive():
+            meta = self._read_meta()
+            last_id = self.store.last_id()
+            if last_id == meta['last_record_id']:
+                return CompiledDataset(self.directory, meta)
+            if last_id < meta['last_record_id']:
+                # The store was replaced; recompile it from scratch
+                meta = self._empty_meta()
+
+            committed = {
+                'symptom_indices': meta['symptom_nnz'],
+                'medicine_indices': meta['medicine_nnz'],
+            }
+            for name, dtype in COLUMNS.items():
+                self._truncate(name, committed.get(name, meta['n_rows']) * np.dtype(dtype).itemsize)
+
+            vocab = meta['vocab']
+            ids = {name: {label: i for i, label in enumerate(vocab[name])} for name in VOCABULARIES}
+            digest = bytes.fromhex(meta['data_digest'])
+            added = 0
+            for batch in self._batches(meta['last_record_id']):
+                columns = {name: [] for name in COLUMNS}
+                cleaned_batch = []
+                for record_id, record in batch:
+                    meta['last_record_id'] = record_id
+                    cleaned = clean_record(record)
+                    if cleaned is None:
+                        continue
+                    cleaned_batch.append(cleaned)
+                    symptoms = safe_split(cleaned['Symptoms'])
+                    medicines = safe_split(cleaned['Medicine'])
+                    columns['record_ids'].append(record_id)
+                    columns['ages'].append(cleaned['Age'])
+                    columns['genders'].append(1 if cleaned['Gender'].startswith('M') else 0)
+                    columns['cause_ids'].append(self._encode(cleaned['Causes'], ids['causes'], vocab['causes']))
+                    columns['disease_ids'].append(self._encode(cleaned['Disease'], ids['diseases'], vocab['diseases']))
+                    columns['symptom_counts'].append(len(symptoms))
+                    columns['symptom_indices'].extend(
+                        self._encode(label, ids['symptoms'], vocab['symptoms']) for label in symptoms)
+                    columns['medicine_counts'].append(len(medicines))
+                    columns['medicine_indices'].extend(
+                        self._encode(label, ids['medicines'], vocab['medicines']) for label in medicines)
+
+                for name, dtype in COLUMNS.items():
+                    with open(self._column_path(name), 'ab') as f:
+                        np.asarray(columns[name], dtype=dtype).tofile(f)
+                        f.flush()
+                        os.fsync(f.fileno())
+                digest = chain_digest(cleaned_batch, digest)
+                meta['n_rows'] += len(cleaned_batch)
+                meta['symptom_nnz'] += len(columns['symptom_indices'])
+                meta['medicine_nnz'] += len(columns['medicine_indices'])
+                added += len(cleaned_batch)
+
+            meta['data_digest'] = digest.hex()
+            self._write_meta(meta)
+            logger.info(f"Compiled {added} new records into {self.directory} ({meta['n_rows']} total)")
+            return CompiledDataset(self.directory, meta)
+
+    def _batches(self, after_id: int, batch_size: int = 10000):
+        batch = []
+        for row in self.store.iter_rows(after_id):
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _truncate(self, name: str, size: int) -> None:
+        """Drop bytes appended by a refresh that never committed its meta.json"""
+        path = self._column_path(name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+        elif not os.path.exists(path):
+            open(path, 'wb').close()
+
+    @staticmethod
+    def _encode(label: str, ids: Dict[str, int], vocabulary: List[str]) -> int:
+        """Id of label, adding it to the vocabulary the first time it is seen"""
+        label_id = ids.get(label)
+        if label_id is None:
+            label_id = ids[label] = len(vocabulary)
+            vocabulary.append(label)
+        return label_id
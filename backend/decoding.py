@@ -0,0 +1,69 @@
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+
+def top_k(scores: np.ndarray, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and values of the k highest scores in each row, best first.
+
+    Uses argpartition so only k candidates per row are sorted. Ties are
+    broken toward the lower column index. k=None keeps every column.
+    """
+    n_rows, n_cols = scores.shape
+    k = n_cols if k is None else min(k, n_cols)
+    if k < n_cols:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        # argpartition picks arbitrarily among scores tied with the k-th best;
+        # where it left some out, keep the leftmost tied columns instead
+        kth = np.take_along_axis(scores, candidates, axis=1).min(axis=1, keepdims=True)
+        tied = scores == kth
+        rows = np.flatnonzero(tied.sum(axis=1) > np.take_along_axis(tied, candidates, axis=1).sum(axis=1))
+        if len(rows):
+            above = scores[rows] > kth[rows]
+            keep = above | (tied[rows] & (np.cumsum(tied[rows], axis=1) <= k - above.sum(axis=1, keepdims=True)))
+            candidates[rows] = np.nonzero(keep)[1].reshape(len(rows), k)
+    else:
+        candidates = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    values = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -values), axis=-1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def decode_top_k(scores: np.ndarray, names: np.ndarray, k: Optional[int] = None,
+                 threshold: float = 0.0, mask: Optional[np.ndarray] = None) -> List[List[Tuple[str, float]]]:
+    """Turn a probability matrix into per-row [(name, confidence %)] lists.
+
+    Only scores above threshold (and, if given, where mask is True) are kept.
+    """
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+    indices, values = top_k(scores, k)
+    keep = values > threshold
+    labels = np.asarray(names, dtype=object)[indices]
+    percents = values * 100
+    return [
+        list(zip(row_labels[row_keep].tolist(), row_percents[row_keep].tolist()))
+        for row_labels, row_percents, row_keep in zip(labels, percents, keep)
+    ]
+
+
+def multioutput_confidence(probas: Sequence[np.ndarray],
+                           classes: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Collapse a multi-output classifier's predict_proba list into matrices.
+
+    Returns (confidence, positive), both shaped (n_samples, n_outputs):
+    the probability of each output's predicted class, and whether that
+    predicted class is 1.
+    """
+    n_samples, n_outputs = probas[0].shape[0], len(probas)
+    confidence = np.ones((n_samples, n_outputs))
+    positive = np.zeros((n_samples, n_outputs), dtype=bool)
+
+    # Outputs that saw both labels in training; the rest always predict their one class
+    binary = np.array([len(output_classes) == 2 for output_classes in classes])
+    if binary.any():
+        stacked = np.stack([probas[j] for j in np.flatnonzero(binary)], axis=1)
+        confidence[:, binary] = stacked.max(axis=2)
+        positive[:, binary] = stacked[:, :, 1] > stacked[:, :, 0]
+    for j in np.flatnonzero(~binary):
+        positive[:, j] = classes[j][0] == 1
+    return confidence, positive
@@ -0,0 +1,79 @@
+import os
+import scipy.sparse as sp
+from contextlib import contextmanager
+from joblib import effective_n_jobs, parallel_config
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.ensemble import (ExtraTreesClassifier, GradientBoostingClassifier,
+                              HistGradientBoostingClassifier, RandomForestClassifier)
+from sklearn.multioutput import MultiOutputClassifier
+from sklearn.pipeline import make_pipeline
+from threadpoolctl import threadpool_limits
+
+# Per-deployment model choice; the defaults are the original estimators
+DISEASE_MODEL = os.getenv('DISEASE_MODEL', 'gradient_boosting')
+MEDICINE_MODEL = os.getenv('MEDICINE_MODEL', 'random_forest')
+# Threads shared by every parallel fit; -1 uses all cores
+TRAINING_N_JOBS = int(os.getenv('TRAINING_N_JOBS', '-1'))
+
+
+class Densify(BaseEstimator, TransformerMixin):
+    """Turn the sparse feature matrix dense for estimators that need it"""
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return X.toarray() if sp.issparse(X) else X
+
+
+def _hist_gradient_boosting():
+    return make_pipeline(Densify(), HistGradientBoostingClassifier(max_iter=100, random_state=42))
+
+
+# n_jobs is left unset so the estimators follow training_parallelism() while
+# fitting and predict single requests on the calling thread. HistGradientBoosting
+# uses OpenMP threads rather than joblib, which training_parallelism() caps
+DISEASE_MODELS = {
+    'gradient_boosting': lambda: GradientBoostingClassifier(n_estimators=100, random_state=42),
+    'hist_gradient_boosting': _hist_gradient_boosting,
+    'random_forest': lambda: RandomForestClassifier(n_estimators=100, random_state=42),
+}
+MEDICINE_MODELS = {
+    # Tree ensembles fit every medicine output in one forest
+    'random_forest': lambda: RandomForestClassifier(n_estimators=100, random_state=42),
+    'extra_trees': lambda: ExtraTreesClassifier(n_estimators=100, random_state=42),
+    # One boosted model per medicine, fitted in turn; each already spreads over
+    # every OpenMP thread, so fitting outputs side by side would oversubscribe
+    'hist_gradient_boosting': lambda: MultiOutputClassifier(_hist_gradient_boosting(), n_jobs=1),
+}
+
+
+def make_disease_classifier(backend: str = DISEASE_MODEL):
+    if backend not in DISEASE_MODELS:
+        raise ValueError(f"Unknown DISEASE_MODEL {backend!r}; expected one of {sorted(DISEASE_MODELS)}")
+    return DISEASE_MODELS[backend]()
+
+
+def make_medicine_classifier(backend: str = MEDICINE_MODEL):
+    if backend not in MEDICINE_MODELS:
+        raise ValueError(f"Unknown MEDICINE_MODEL {backend!r}; expected one of {sorted(MEDICINE_MODELS)}")
+    return MEDICINE_MODELS[backend]()
+
+
+def medicine_classes(medicine_classifier):
+    """Per-output class labels of a fitted multi-output classifier"""
+    if isinstance(medicine_classifier, MultiOutputClassifier):
+        return [estimator.classes_ for estimator in medicine_classifier.estimators_]
+    return medicine_classifier.classes_
+
+
+@contextmanager
+def training_parallelism(n_jobs: int = TRAINING_N_JOBS):
+    """Fit inside this block to spread training over n_jobs threads.
+
+    The forests build trees on joblib's threading backend; HistGradientBoosting
+    only parallelises through OpenMP, so that thread pool is capped to match.
+    """
+    with parallel_config(backend='threading', n_jobs=n_jobs), \
+            threadpool_limits(limits=effective_n_jobs(n_jobs), user_api='openmp'):
+        yield
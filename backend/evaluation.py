@@ -0,0 +1,166 @@
+import os
+import time
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, f1_score, hamming_loss, precision_recall_fscore_support
+from sklearn.model_selection import KFold, StratifiedKFold
+from typing import Any, Dict, Sequence, Tuple
+from decoding import top_k
+from estimators import TRAINING_N_JOBS, medicine_classes, training_parallelism
+
+# Folds of the cross-validation run for every new model version; 0 turns it off
+EVAL_FOLDS = int(os.getenv('EVAL_FOLDS', '5'))
+# Processes fitting folds at the same time; -1 uses all cores
+EVAL_N_JOBS = int(os.getenv('EVAL_N_JOBS', str(TRAINING_N_JOBS)))
+TOP_K = (1, 3, 5)
+
+
+def positive_probability(probas: Sequence[np.ndarray], classes: Sequence[np.ndarray]) -> np.ndarray:
+    """P(label is 1) for each output of a multi-output classifier, (n_samples, n_outputs)"""
+    n_samples = probas[0].shape[0]
+    positive = np.zeros((n_samples, len(probas)))
+    for j, (proba, output_classes) in enumerate(zip(probas, classes)):
+        matches = np.flatnonzero(np.asarray(output_classes) == 1)
+        if len(matches):
+            positive[:, j] = proba[:, matches[0]]
+    return positive
+
+
+def _fit_fold(disease_classifier, medicine_classifier, X, y_diseases, y_medicines,
+              train: np.ndarray, test: np.ndarray, n_diseases: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fit unfitted copies of both classifiers on one fold and score its held-out rows"""
+    disease_classifier = clone(disease_classifier)
+    medicine_classifier = clone(medicine_classifier)
+    # Folds already run side by side, so each fits on a single thread
+    with training_parallelism(1):
+        disease_classifier.fit(X[train], y_diseases[train])
+        medicine_classifier.fit(X[train], y_medicines[train])
+
+    # A fold may miss rare diseases, and incremental classifiers reserve ids for
+    # diseases and medicines not seen yet; line columns up with the known labels
+    disease_probs = np.zeros((len(test), n_diseases))
+    classes = np.asarray(disease_classifier.classes_)
+    known = classes < n_diseases
+    disease_probs[:, classes[known]] = disease_classifier.predict_proba(X[test])[:, known]
+    medicine_probs = positive_probability(medicine_classifier.predict_proba(X[test]),
+                                          medicine_classes(medicine_classifier))
+    return test, disease_probs, medicine_probs[:, :y_medicines.shape[1]]
+
+
+def _splitter(y_diseases: np.ndarray, n_splits: int):
+    # Stratify on disease when every class can appear in each fold
+    if np.bincount(y_diseases).min() >= n_splits:
+        return StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+    return KFold(n_splits=n_splits, shuffle=True, random_state=42)
+
+
+def out_of_fold_scores(disease_classifier, medicine_classifier, X, y_diseases: np.ndarray,
+                       y_medicines, n_diseases: int, n_splits: int = EVAL_FOLDS,
+                       n_jobs: int = EVAL_N_JOBS) -> Tuple[np.ndarray, np.ndarray]:
+    """Disease and medicine probabilities for every row from the fold that held it out.
+
+    Each fold fits fresh copies of the given classifiers in its own worker
+    process, so folds train in parallel across cores.
+    """
+    y_medicines = y_medicines.toarray() if hasattr(y_medicines, 'toarray') else np.asarray(y_medicines)
+    folds = _splitter(y_diseases, n_splits).split(X, y_diseases)
+    results = Parallel(n_jobs=min(n_jobs, n_splits) if n_jobs > 0 else n_jobs)(
+        delayed(_fit_fold)(disease_classifier, medicine_classifier, X, y_diseases, y_medicines,
+                           train, test, n_diseases)
+        for train, test in folds
+    )
+
+    disease_probs = np.zeros((X.shape[0], n_diseases))
+    medicine_probs = np.zeros(y_medicines.shape)
+    for test, fold_disease_probs, fold_medicine_probs in results:
+        disease_probs[test] = fold_disease_probs
+        medicine_probs[test] = fold_medicine_probs
+    return disease_probs, medicine_probs
+
+
+def _per_class(y_true, y_pred, names: Sequence[str]) -> Dict[str, Dict[str, float]]:
+    precision, recall, f1, support = precision_recall_fscore_support(
+        y_true, y_pred, labels=None if np.ndim(y_true) > 1 else np.arange(len(names)), zero_division=0
+    )
+    return {
+        str(name): {'precision': round(float(p), 4), 'recall': round(float(r), 4),
+                    'f1': round(float(f), 4), 'support': int(s)}
+        for name, p, r, f, s in zip(names, precision, recall, f1, support)
+    }
+
+
+def disease_metrics(y_true: np.ndarray, probs: np.ndarray, names: Sequence[str]) -> Dict[str, Any]:
+    y_pred = probs.argmax(axis=1)
+    ranked, _ = top_k(probs, max(TOP_K))
+    return {
+        'accuracy': round(float(accuracy_score(y_true, y_pred)), 4),
+        'top_k_accuracy': {
+            str(k): round(float((ranked[:, :k] == y_true[:, None]).any(axis=1).mean()), 4) for k in TOP_K
+        },
+        'macro_f1': round(float(f1_score(y_true, y_pred, average='macro', zero_division=0)), 4),
+        'weighted_f1': round(float(f1_score(y_true, y_pred, average='weighted', zero_division=0)), 4),
+        'per_class': _per_class(y_true, y_pred, names)
+    }
+
+
+def medicine_metrics(y_true: np.ndarray, probs: np.ndarray, names: Sequence[str]) -> Dict[str, Any]:
+    y_pred = (probs > 0.5).astype(y_true.dtype)
+    ranked, _ = top_k(probs, max(TOP_K))
+    relevant = np.maximum(y_true.sum(axis=1), 1)
+    top_k_metrics = {}
+    for k in TOP_K:
+        hits = np.take_along_axis(y_true, ranked[:, :k], axis=1).sum(axis=1)
+        top_k_metrics[str(k)] = {
+            # At least one prescribed medicine among the k highest ranked
+            'hit_rate': round(float((hits > 0).mean()), 4),
+            'precision': round(float((hits / min(k, probs.shape[1])).mean()), 4),
+            'recall': round(float((hits / relevant).mean()), 4)
+        }
+    return {
+        # Every medicine of a record right, as the 80/20 holdout score measured it
+        'subset_accuracy': round(float(accuracy_score(y_true, y_pred)), 4),
+        'hamming_loss': round(float(hamming_loss(y_true, y_pred)), 4),
+        'micro_f1': round(float(f1_score(y_true, y_pred, average='micro', zero_division=0)), 4),
+        'macro_f1': round(float(f1_score(y_true, y_pred, average='macro', zero_division=0)), 4),
+        'top_k': top_k_metrics,
+        'per_class': _per_class(y_true, y_pred, names)
+    }
+
+
+def cross_validate(disease_classifier, medicine_classifier, X, y_diseases: np.ndarray, y_medicines,
+                   disease_names: Sequence[str], medicine_names: Sequence[str],
+                   n_splits: int = EVAL_FOLDS, n_jobs: int = EVAL_N_JOBS) -> Dict[str, Any]:
+    """k-fold cross-validated disease and medicine metrics for the given (unfitted) classifiers"""
+    started = time.perf_counter()
+    disease_probs, medicine_probs = out_of_fold_scores(
+        disease_classifier, medicine_classifier, X, y_diseases, y_medicines,
+        len(disease_names), n_splits, n_jobs
+    )
+    y_medicines = y_medicines.toarray() if hasattr(y_medicines, 'toarray') else np.asarray(y_medicines)
+    return {
+        'method': 'cross_validation',
+        'folds': n_splits,
+        'samples': int(X.shape[0]),
+        'disease': disease_metrics(y_diseases, disease_probs, disease_names),
+        'medicine': medicine_metrics(y_medicines, medicine_probs, medicine_names),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def summary(report: Dict[str, Any]) -> Dict[str, Any]:
+    """The headline numbers of a report, in percent, for API responses"""
+    return {
+        'disease_accuracy': round(report['disease']['accuracy'] * 100, 2),
+        'medicine_accuracy': round(report['medicine']['subset_accuracy'] * 100, 2),
+        'disease_top_3_accuracy': round(report['disease']['top_k_accuracy']['3'] * 100, 2),
+        'medicine_top_3_hit_rate': round(report['medicine']['top_k']['3']['hit_rate'] * 100, 2),
+        'method': report['method'],
+        'folds': report['folds']
+    }
+
+
+def evaluation_folds(n_samples: int, n_splits: int = EVAL_FOLDS) -> int:
+    """Folds to use for n_samples rows, or 0 if there are too few to cross-validate"""
+    n_splits = min(n_splits, n_samples)
+    return n_splits if n_splits >= 2 else 0
@@ -0,0 +1,57 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import MultiLabelBinarizer, OneHotEncoder
+from typing import Dict, List, Optional, Sequence
+from normalization import InputNormalizer
+
+# Tree ensembles work in float32 internally, so build features in it directly
+FEATURE_DTYPE = np.float32
+
+
+def make_symptom_encoder() -> MultiLabelBinarizer:
+    return MultiLabelBinarizer(sparse_output=True)
+
+
+def make_cause_encoder() -> OneHotEncoder:
+    # Unseen causes encode as an all-zero block instead of raising
+    return OneHotEncoder(handle_unknown='ignore', sparse_output=True, dtype=FEATURE_DTYPE)
+
+
+def cause_classes(cause_encoder: OneHotEncoder) -> np.ndarray:
+    """Causes known to a fitted cause encoder"""
+    return cause_encoder.categories_[0]
+
+
+def make_normalizer(symptom_encoder: MultiLabelBinarizer, cause_encoder: OneHotEncoder,
+                    record_synonyms: Optional[Dict[str, Dict[str, str]]] = None) -> InputNormalizer:
+    """Normalizer onto the classes of fitted symptom and cause encoders"""
+    return InputNormalizer(symptom_encoder.classes_, cause_classes(cause_encoder),
+                           record_synonyms=record_synonyms)
+
+
+def encode_causes(cause_encoder: OneHotEncoder, causes: Sequence[str], fit: bool = False) -> sp.csr_matrix:
+    column = np.asarray(causes, dtype=object).reshape(-1, 1)
+    if fit:
+        return cause_encoder.fit_transform(column)
+    return cause_encoder.transform(column)
+
+
+def encode_symptoms(symptom_encoder: MultiLabelBinarizer, symptoms: List[List[str]],
+                    fit: bool = False) -> sp.csr_matrix:
+    if fit:
+        return symptom_encoder.fit_transform(symptoms)
+    return symptom_encoder.transform(symptoms)
+
+
+def assemble_features(ages: Sequence[int], genders: Sequence[int], X_symptoms: sp.spmatrix,
+                      X_causes: sp.spmatrix) -> sp.csr_matrix:
+    """Stack [age, gender, symptoms one-hot, cause one-hot] into one CSR matrix"""
+    demographics = np.column_stack([
+        np.asarray(ages, dtype=FEATURE_DTYPE),
+        np.asarray(genders, dtype=FEATURE_DTYPE)
+    ])
+    return sp.hstack([
+        sp.csr_matrix(demographics),
+        X_symptoms.astype(FEATURE_DTYPE),
+        X_causes
+    ], format='csr', dtype=FEATURE_DTYPE)
@@ -0,0 +1,398 @@
+import os
+import json
+import tempfile
+import logging
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from sklearn.multioutput import MultiOutputClassifier
+from sklearn.preprocessing import MultiLabelBinarizer, OneHotEncoder
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from model_artifacts import ARTIFACT_DIR, artifact_key, load_artifacts, save_artifacts
+from dataset_cache import VOCABULARIES, CompiledDataset, safe_split
+from features import FEATURE_DTYPE, encode_causes, encode_symptoms
+from medical_core import MedicalModelCore, ModelScores
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# A full refit after this many incremental updates, or once the rows added
+# since the last refit exceed this fraction of the rows it was fitted on
+INCREMENTAL_REFIT_UPDATES = int(os.getenv('INCREMENTAL_REFIT_UPDATES', '20'))
+INCREMENTAL_REFIT_GROWTH = float(os.getenv('INCREMENTAL_REFIT_GROWTH', '0.5'))
+# Passes over the data in a full refit; an update is a single pass over its batch
+INCREMENTAL_EPOCHS = int(os.getenv('INCREMENTAL_EPOCHS', '5'))
+# Room reserved for labels not seen yet, as a multiple of the current vocabulary
+CAPACITY_FACTOR = 2
+MIN_CAPACITY = 16
+# SGD is sensitive to feature scale; the other features are 0/1
+AGE_SCALE = 100.0
+# Points at the most recently trained incremental model in the artifact directory
+LATEST_FILE = 'incremental_latest.json'
+
+
+def _capacity(size: int) -> int:
+    return max(MIN_CAPACITY, size * CAPACITY_FACTOR)
+
+
+def _sgd(alpha: float, random_state: int) -> SGDClassifier:
+    return SGDClassifier(loss='log_loss', alpha=alpha, random_state=random_state)
+
+
+class OnlineDiseaseClassifier(ClassifierMixin, BaseEstimator):
+    """Log-loss SGD over a fixed range of disease ids.
+
+    All n_classes ids are declared on the first partial_fit, so a disease
+    first seen in a later batch is learned without refitting.
+    """
+
+    def __init__(self, n_classes: int = MIN_CAPACITY, alpha: float = 1e-4,
+                 epochs: int = INCREMENTAL_EPOCHS, random_state: int = 42):
+        self.n_classes = n_classes
+        self.alpha = alpha
+        self.epochs = epochs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        self.model_ = _sgd(self.alpha, self.random_state)
+        self.classes_ = np.arange(self.n_classes)
+        rng = np.random.RandomState(self.random_state)
+        for _ in range(self.epochs):
+            order = rng.permutation(X.shape[0])
+            self.model_.partial_fit(X[order], y[order], classes=self.classes_)
+        return self
+
+    def partial_fit(self, X, y):
+        self.model_.partial_fit(X, y, classes=self.classes_)
+        return self
+
+    def predict_proba(self, X) -> np.ndarray:
+        return self.model_.predict_proba(X)
+
+    def predict(self, X) -> np.ndarray:
+        return self.model_.predict(X)
+
+
+class OnlineMedicineClassifier(BaseEstimator):
+    """One log-loss SGD per medicine slot, n_outputs of them.
+
+    Targets narrower than n_outputs are padded with zeros, so medicines
+    first seen in a later batch take up a free slot without refitting.
+    """
+
+    def __init__(self, n_outputs: int = MIN_CAPACITY, alpha: float = 1e-4,
+                 epochs: int = INCREMENTAL_EPOCHS, random_state: int = 42):
+        self.n_outputs = n_outputs
+        self.alpha = alpha
+        self.epochs = epochs
+        self.random_state = random_state
+
+    @property
+    def classes_(self) -> List[np.ndarray]:
+        return [np.array([0, 1])] * self.n_outputs
+
+    def _targets(self, Y) -> np.ndarray:
+        Y = Y.toarray() if sp.issparse(Y) else np.asarray(Y)
+        padded = np.zeros((Y.shape[0], self.n_outputs), dtype=np.int64)
+        padded[:, :Y.shape[1]] = Y
+        return padded
+
+    def fit(self, X, Y):
+        self.model_ = MultiOutputClassifier(_sgd(self.alpha, self.random_state))
+        Y = self._targets(Y)
+        rng = np.random.RandomState(self.random_state)
+        for _ in range(self.epochs):
+            order = rng.permutation(X.shape[0])
+            self.model_.partial_fit(X[order], Y[order], classes=self.classes_)
+        return self
+
+    def partial_fit(self, X, Y):
+        self.model_.partial_fit(X, self._targets(Y), classes=self.classes_)
+        return self
+
+    def predict_proba(self, X) -> List[np.ndarray]:
+        return self.model_.predict_proba(X)
+
+    def predict(self, X) -> np.ndarray:
+        return self.model_.predict(X)
+
+
+class Vocabulary:
+    """Labels in the order they were first seen; ids never move as labels are added"""
+
+    def __init__(self, labels: Sequence[str] = ()):
+        self.classes_ = np.array(list(labels), dtype=object)
+
+
+def _indicator(counts: np.ndarray, indices: np.ndarray, width: int) -> sp.csr_matrix:
+    """0/1 rows from per-row label counts and the concatenated label ids"""
+    indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    # Copied out of the read-only memory map, since scipy sorts indices in place
+    indices = np.array(indices, dtype=np.int32)
+    matrix = sp.csr_matrix((np.ones(len(indices), dtype=FEATURE_DTYPE), indices, indptr),
+                           shape=(len(counts), width))
+    # A label repeated within one record still encodes as a single 1
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def _widen(X: sp.csr_matrix, width: int) -> sp.csr_matrix:
+    X = X.tocsr().astype(FEATURE_DTYPE)
+    X.resize((X.shape[0], width))
+    return X
+
+
+class IncrementalModelCore(MedicalModelCore):
+    """Model core that updates the previous models with only the new records.
+
+    Features and labels use the dataset cache's ids, which only ever grow,
+    and the classifiers reserve room for labels not seen yet. train() picks
+    up the latest incremental model from the artifact directory and runs
+    one partial_fit pass over the rows added since, so a retrain costs time
+    in proportion to the new rows rather than the whole history. It falls
+    back to a full refit when there is no usable previous model, a
+    vocabulary outgrows its reserved room, or the refit schedule is due.
+    """
+
+    ARTIFACT_ATTRS = MedicalModelCore.ARTIFACT_ATTRS + (
+        'feature_capacity', 'trained_rows', 'trained_last_record_id',
+        'rows_at_refit', 'updates_since_refit', 'scored_rows')
+
+    def __init__(self, artifact_dir: Optional[str] = ARTIFACT_DIR):
+        super().__init__(artifact_dir)
+        self.disease_classifier = OnlineDiseaseClassifier()
+        self.medicine_classifier = OnlineMedicineClassifier()
+        self.feature_capacity = {'symptoms': MIN_CAPACITY, 'causes': MIN_CAPACITY}
+        self.trained_rows = 0
+        self.trained_last_record_id = 0
+        self.rows_at_refit = 0
+        self.updates_since_refit = 0
+        self.scored_rows = 0
+
+    def estimators(self) -> Dict[str, Any]:
+        # Encoders follow the dataset vocabulary, which the data digest already covers
+        return {
+            'disease_classifier': self.disease_classifier,
+            'medicine_classifier': self.medicine_classifier
+        }
+
+    def _config_key(self) -> str:
+        """Identifies the model settings, so a previous model is only updated if they match"""
+        settings = {
+            name: {key: value for key, value in estimator.get_params().items()
+                   if key not in ('n_classes', 'n_outputs')}
+            for name, estimator in self.estimators().items()
+        }
+        return json.dumps(settings, sort_keys=True)
+
+    def _set_vocabulary(self, vocab: Dict[str, List[str]]) -> None:
+        self.symptom_encoder = MultiLabelBinarizer(classes=list(vocab['symptoms']), sparse_output=True).fit([])
+        causes = np.array(vocab['causes'], dtype=object)
+        self.cause_encoder = OneHotEncoder(categories=[causes], handle_unknown='ignore',
+                                           sparse_output=True, dtype=FEATURE_DTYPE).fit(causes.reshape(-1, 1))
+        self.disease_encoder = Vocabulary(vocab['diseases'])
+        self.medicine_encoder = Vocabulary(vocab['medicines'])
+        self.normalizer = None
+
+    def _vocab_sizes(self) -> Dict[str, int]:
+        return {
+            'symptoms': len(self.symptom_encoder.classes_),
+            'causes': len(self.cause_encoder.categories_[0]),
+            'diseases': len(self.disease_encoder.classes_),
+            'medicines': len(self.medicine_encoder.classes_)
+        }
+
+    def _capacities(self) -> Dict[str, int]:
+        return {**self.feature_capacity, 'diseases': self.disease_classifier.n_classes,
+                'medicines': self.medicine_classifier.n_outputs}
+
+    def _dataset_rows(self, dataset: CompiledDataset, start: int, end: int) -> Tuple[sp.csr_matrix, np.ndarray, sp.csr_matrix]:
+        """Features and targets of dataset rows start:end, straight from the cached ids"""
+        # Summing the counts before start reads one int per earlier row; it
+        # is negligible next to encoding and fitting the batch
+        symptom_start = int(dataset.symptom_counts[:start].sum())
+        medicine_start = int(dataset.medicine_counts[:start].sum())
+        symptom_counts = np.asarray(dataset.symptom_counts[start:end])
+        medicine_counts = np.asarray(dataset.medicine_counts[start:end])
+        X_symptoms = _indicator(
+            symptom_counts, dataset.symptom_indices[symptom_start:symptom_start + symptom_counts.sum()],
+            self.feature_capacity['symptoms'])
+        X_causes = _indicator(
+            np.ones(end - start, dtype=np.int64), dataset.cause_ids[start:end], self.feature_capacity['causes'])
+        X = self._assemble(np.asarray(dataset.ages[start:end]), np.asarray(dataset.genders[start:end]),
+                           X_symptoms, X_causes)
+        y_diseases = np.asarray(dataset.disease_ids[start:end], dtype=np.int64)
+        Y_medicines = _indicator(
+            medicine_counts, dataset.medicine_indices[medicine_start:medicine_start + medicine_counts.sum()],
+            len(self.medicine_encoder.classes_))
+        return X, y_diseases, Y_medicines
+
+    @staticmethod
+    def _assemble(ages, genders, X_symptoms: sp.csr_matrix, X_causes: sp.csr_matrix) -> sp.csr_matrix:
+        demographics = np.column_stack([
+            np.asarray(ages, dtype=FEATURE_DTYPE) / AGE_SCALE,
+            np.asarray(genders, dtype=FEATURE_DTYPE)
+        ])
+        return sp.hstack([sp.csr_matrix(demographics), X_symptoms, X_causes], format='csr', dtype=FEATURE_DTYPE)
+
+    def fit_features(self, dataset: CompiledDataset) -> Tuple[sp.csr_matrix, np.ndarray, sp.csr_matrix]:
+        """Size the encoders and classifiers for the dataset and return its X and targets"""
+        if not isinstance(dataset, CompiledDataset):
+            raise TypeError("Incremental training needs a CompiledDataset")
+        self._set_vocabulary(dataset.vocab)
+        sizes = self._vocab_sizes()
+        self.feature_capacity = {'symptoms': _capacity(sizes['symptoms']), 'causes': _capacity(sizes['causes'])}
+        self.disease_classifier.set_params(n_classes=_capacity(sizes['diseases']))
+        self.medicine_classifier.set_params(n_outputs=_capacity(sizes['medicines']))
+        return self._dataset_rows(dataset, 0, len(dataset))
+
+    def train(self, training_data: CompiledDataset) -> None:
+        """Update the latest incremental model with the new rows, or refit from scratch"""
+        if not isinstance(training_data, CompiledDataset):
+            raise TypeError("Incremental training needs a CompiledDataset")
+        if not len(training_data):
+            raise ValueError("No valid training data after cleaning")
+        self.normalizer = None
+        self.evaluation = None
+        self.model_version = artifact_key(training_data.data_digest, self.estimators())
+        if self.load_version(self.model_version):
+            logger.info(f"Loaded trained models {self.model_version} from {self.artifact_dir}")
+            self._log_accuracies()
+            return
+
+        previous = self._latest_state()
+        if previous is not None:
+            self._restore(previous)
+        reason = self._refit_reason(training_data) if previous is not None else "no previous incremental model"
+        if reason is None:
+            with timed('train_update'):
+                self._update(training_data)
+        else:
+            logger.info(f"Refitting from scratch: {reason}")
+            self.disease_classifier = OnlineDiseaseClassifier()
+            self.medicine_classifier = OnlineMedicineClassifier()
+            self._full_fit(training_data)
+        self.record_synonyms = self.derive_record_synonyms(training_data)
+        self._log_accuracies()
+
+        with timed('artifact_save'):
+            save_artifacts(self.artifact_dir, self.model_version, 'core',
+                           {attr: getattr(self, attr) for attr in self.ARTIFACT_ATTRS})
+            self._save_latest()
+
+    def _refit_reason(self, dataset: CompiledDataset) -> Optional[str]:
+        """Why the restored model can't just be updated with the new rows, or None"""
+        if len(dataset) < self.trained_rows or dataset.last_record_id < self.trained_last_record_id:
+            return "the dataset was rebuilt"
+        known = {
+            'symptoms': self.symptom_encoder.classes_, 'causes': self.cause_encoder.categories_[0],
+            'diseases': self.disease_encoder.classes_, 'medicines': self.medicine_encoder.classes_
+        }
+        capacities = self._capacities()
+        for name in VOCABULARIES:
+            if list(dataset.vocab[name][:len(known[name])]) != list(known[name]):
+                return f"the {name} ids changed"
+            if len(dataset.vocab[name]) > capacities[name]:
+                return f"more {name} than the model has room for"
+        if self.updates_since_refit >= INCREMENTAL_REFIT_UPDATES:
+            return f"{self.updates_since_refit} updates since the last refit"
+        if len(dataset) - self.rows_at_refit > INCREMENTAL_REFIT_GROWTH * self.rows_at_refit:
+            return f"the data grew from {self.rows_at_refit} to {len(dataset)} rows since the last refit"
+        return None
+
+    def _full_fit(self, dataset: CompiledDataset) -> None:
+        logger.info(f"Using {len(dataset)} compiled records for training")
+        logger.info("Preparing features...")
+        with timed('train_features'):
+            X, y_diseases, Y_medicines = self.fit_features(dataset)
+
+        X_train, X_test, y_disease_train, y_disease_test, y_medicine_train, y_medicine_test = \
+            train_test_split(X, y_diseases, Y_medicines, test_size=0.2, random_state=42)
+
+        with timed('train_fit'):
+            logger.info("Training disease classifier...")
+            self.disease_classifier.fit(X_train, y_disease_train)
+            logger.info("Training medicine classifier...")
+            self.medicine_classifier.fit(X_train, y_medicine_train)
+        self.disease_accuracy, self.medicine_accuracy = self._score(X_test, y_disease_test, y_medicine_test)
+        self.scored_rows = X_test.shape[0]
+        self.trained_rows = self.rows_at_refit = len(dataset)
+        self.trained_last_record_id = dataset.last_record_id
+        self.updates_since_refit = 0
+
+    def _update(self, dataset: CompiledDataset) -> None:
+        start, end = self.trained_rows, len(dataset)
+        logger.info(f"Updating models with {end - start} new records ({end} total)")
+        self._set_vocabulary(dataset.vocab)
+        if end > start:
+            X, y_diseases, Y_medicines = self._dataset_rows(dataset, start, end)
+            # Score each batch before learning from it, so accuracy stays out-of-sample
+            disease_accuracy, medicine_accuracy = self._score(X, y_diseases, Y_medicines)
+            scored = self.scored_rows + (end - start)
+            self.disease_accuracy = (self.disease_accuracy * self.scored_rows
+                                     + disease_accuracy * (end - start)) / scored
+            self.medicine_accuracy = (self.medicine_accuracy * self.scored_rows
+                                      + medicine_accuracy * (end - start)) / scored
+            self.scored_rows = scored
+            self.disease_classifier.partial_fit(X, y_diseases)
+            self.medicine_classifier.partial_fit(X, Y_medicines)
+        self.trained_rows = end
+        self.trained_last_record_id = dataset.last_record_id
+        self.updates_since_refit += 1
+
+    def _score(self, X: sp.csr_matrix, y_diseases: np.ndarray, Y_medicines: sp.csr_matrix) -> Tuple[float, float]:
+        if not X.shape[0]:
+            return 0.0, 0.0
+        disease_accuracy = accuracy_score(y_diseases, self.disease_classifier.predict(X))
+        medicine_accuracy = accuracy_score(
+            Y_medicines.toarray(), self.medicine_classifier.predict(X)[:, :Y_medicines.shape[1]])
+        return float(disease_accuracy), float(medicine_accuracy)
+
+    def _latest_path(self) -> str:
+        return os.path.join(self.artifact_dir, LATEST_FILE)
+
+    def _latest_state(self) -> Optional[Dict[str, Any]]:
+        """Fitted state of the most recently trained incremental model with these settings"""
+        if not self.artifact_dir:
+            return None
+        try:
+            with open(self._latest_path()) as f:
+                latest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if latest.get('config') != self._config_key():
+            return None
+        return load_artifacts(self.artifact_dir, latest['model_version'], 'core')
+
+    def _save_latest(self) -> None:
+        if not self.artifact_dir:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.artifact_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'model_version': self.model_version, 'config': self._config_key()}, f)
+        os.replace(tmp_path, self._latest_path())
+
+    def build_features(self, ages: Sequence[int], genders: Sequence[Any], symptoms: Sequence[Any],
+                       causes: Sequence[Any]) -> sp.csr_matrix:
+        normalizer = self.get_normalizer()
+        X_symptoms = encode_symptoms(self.symptom_encoder,
+                                     [normalizer.symptoms(safe_split(s)) for s in symptoms])
+        X_causes = encode_causes(self.cause_encoder, [normalizer.cause(cause) for cause in causes])
+        genders = [1 if str(gender).upper() == 'M' else 0 for gender in genders]
+        return self._assemble(ages, genders, _widen(X_symptoms, self.feature_capacity['symptoms']),
+                              _widen(X_causes, self.feature_capacity['causes']))
+
+    def predict_scores(self, patients: Sequence[Dict[str, Any]]) -> ModelScores:
+        """Scores for the known diseases and medicines, without the reserved slots"""
+        scores = super().predict_scores(patients)
+        n_diseases = len(self.disease_encoder.classes_)
+        n_medicines = len(self.medicine_encoder.classes_)
+        disease_probs = scores.disease_probs[:, :n_diseases]
+        disease_probs = disease_probs / np.maximum(disease_probs.sum(axis=1, keepdims=True), 1e-12)
+        return ModelScores(disease_probs, scores.medicine_confidence[:, :n_medicines],
+                           scores.medicine_recommended[:, :n_medicines])
@@ -1,42 +1,191 @@
-import requests
+import httpx
+import json
+import asyncio
+import logging
+import random
 import os
-import threading
-import time
+from metrics import LLM_REQUESTS, timed
+from proxy_supervisor import ProxySupervisor
 
-def start_server():
-    os.system("node clewd.js")
+logger = logging.getLogger(__name__)
 
-def initialize_server():
-    server_thread = threading.Thread(target=start_server)
-    server_thread.daemon = True  # Make thread daemon so it exits when main program ends
-    server_thread.start()
-    time.sleep(3)  # Wait for server to start
+LLM_URL = os.getenv('LLM_URL', "http://127.0.0.1:8444/v1/chat/completions")
+LLM_MODEL = "claude-3-5-sonnet-20241022"
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_BACKOFF = float(os.getenv('LLM_BACKOFF', '0.5'))
+# Responses worth retrying: rate limiting and transient proxy/upstream failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-def query_claude(query, system_prompt="You are Claude, an AI assistant."):
-    url = "http://127.0.0.1:8444/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json"
-    }
+# Created by the first query_claude call; the API itself only uses httpx
+_session = None
 
+# Started on first use (or by the app at startup) instead of at import
+proxy = ProxySupervisor(LLM_URL)
+
+def _chat_payload(query, system_prompt, max_tokens=1024, stream=False):
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": query}
     ]
 
-    data = {
-        "model": "claude-3-5-sonnet-20241022",
+    return {
+        "model": LLM_MODEL,
         "messages": messages,
-        "max_tokens": 1024,
-        "stream": False
+        "max_tokens": max_tokens,
+        "stream": stream
     }
 
+def query_claude(query, system_prompt="You are Claude, an AI assistant."):
+    """Blocking query, for scripts; the API uses aquery_claude"""
+    global _session
+    import requests
+
+    if _session is None:
+        _session = requests.Session()
+    headers = {
+        "Content-Type": "application/json"
+    }
+
+    proxy.ensure_ready_sync()
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = _session.post(LLM_URL, headers=headers, json=_chat_payload(query, system_prompt))
         response.raise_for_status()
         result = response.json()
         return result['choices'][0]['message']['content']
     except requests.exceptions.RequestException as e:
         return f"Error: {str(e)}"
 
-# Initialize server when module is imported
-initialize_server()
\ No newline at end of file
+class LLMClient:
+    """Async client for the OpenAI-compatible proxy.
+
+    Keeps one pooled httpx connection set per process, caps the number of
+    requests in flight, and retries connection errors and retryable status
+    codes with exponential backoff and jitter. When given a supervisor, waits
+    for the proxy to be listening before each attempt and has it re-probed
+    (and restarted if needed) after a connection failure.
+    """
+
+    def __init__(self, url=LLM_URL, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, max_retries=LLM_MAX_RETRIES, backoff=LLM_BACKOFF,
+                 proxy=None):
+        self.url = url
+        self.proxy = proxy
+        self.max_concurrency = max_concurrency
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+        return self._client
+
+    async def _ensure_proxy(self):
+        if self.proxy is not None:
+            await self.proxy.ensure_ready()
+
+    def _connection_failed(self, error):
+        if self.proxy is not None and isinstance(error, httpx.ConnectError):
+            self.proxy.mark_down()
+
+    async def _sleep_before_retry(self, attempt):
+        delay = self.backoff * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def complete(self, query, system_prompt, max_tokens=1024):
+        """Return the assistant message for one chat completion"""
+        payload = _chat_payload(query, system_prompt, max_tokens)
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._ensure_proxy()
+                async with self._semaphore:
+                    with timed('llm_request'):
+                        response = await self._get_client().post(self.url, json=payload)
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    logger.warning(f"LLM returned {response.status_code}, retrying (attempt {attempt + 1})")
+                    LLM_REQUESTS.inc(outcome='retry')
+                    await self._sleep_before_retry(attempt)
+                    continue
+                response.raise_for_status()
+                content = response.json()['choices'][0]['message']['content']
+                LLM_REQUESTS.inc(outcome='ok')
+                return content
+            except httpx.TransportError as e:
+                self._connection_failed(e)
+                if attempt >= self.max_retries:
+                    LLM_REQUESTS.inc(outcome='error')
+                    raise
+                logger.warning(f"LLM request failed: {str(e)}, retrying (attempt {attempt + 1})")
+                LLM_REQUESTS.inc(outcome='retry')
+                await self._sleep_before_retry(attempt)
+            except (httpx.HTTPStatusError, KeyError, ValueError):
+                LLM_REQUESTS.inc(outcome='error')
+                raise
+
+    async def stream(self, query, system_prompt, max_tokens=1024):
+        """Yield the assistant message piece by piece as the proxy generates it.
+
+        Failures before the first piece arrives are retried like complete();
+        once text has been yielded a failure is raised to the caller.
+        """
+        payload = _chat_payload(query, system_prompt, max_tokens, stream=True)
+        for attempt in range(self.max_retries + 1):
+            received = False
+            try:
+                await self._ensure_proxy()
+                async with self._semaphore:
+                    async with self._get_client().stream('POST', self.url, json=payload) as response:
+                        if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                            logger.warning(f"LLM returned {response.status_code}, retrying (attempt {attempt + 1})")
+                        else:
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if not line.startswith('data:'):
+                                    continue
+                                data = line[len('data:'):].strip()
+                                if data == '[DONE]':
+                                    break
+                                content = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                                if content:
+                                    received = True
+                                    yield content
+                            LLM_REQUESTS.inc(outcome='ok')
+                            return
+            except httpx.TransportError as e:
+                self._connection_failed(e)
+                if received or attempt >= self.max_retries:
+                    LLM_REQUESTS.inc(outcome='error')
+                    raise
+                logger.warning(f"LLM stream failed: {str(e)}, retrying (attempt {attempt + 1})")
+            except GeneratorExit:
+                # The caller stopped reading once it had everything it needed
+                LLM_REQUESTS.inc(outcome='ok')
+                raise
+            except (httpx.HTTPStatusError, KeyError, ValueError):
+                LLM_REQUESTS.inc(outcome='error')
+                raise
+            LLM_REQUESTS.inc(outcome='retry')
+            await self._sleep_before_retry(attempt)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+llm_client = LLMClient(proxy=proxy)
+
+async def aquery_claude(query, system_prompt="You are Claude, an AI assistant."):
+    """Non-blocking query_claude; errors come back as an "Error: ..." string"""
+    try:
+        return await llm_client.complete(query, system_prompt)
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        return f"Error: {str(e)}"
@@ -1,22 +1,74 @@
 from fastapi import FastAPI, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from contextlib import aclosing, asynccontextmanager
 from pathlib import Path
-import PyPDF2
-import io
+import asyncio
 import logging
-from llm import query_claude
-import re, json
-from medical_recommender import AdvancedMedicalPredictor
-from medical_predictor import MedicalPredictor, load_training_data
-from data_cleaner import clean_excel_data, update_json_data
-import pandas as pd
+import time
+from llm import aquery_claude, llm_client, proxy
+import json
+import hashlib
+import os
+from model_registry import registry
+from training_jobs import TrainingScheduler
+from analysis_cache import AnalysisCache, pdf_key, text_key
+from report_json import AnalysisError, JSONSectionScanner, ReportAnalysis, parse_analysis, validate_section
+from pydantic import ValidationError
+from report_chunking import merge_analyses, split_report
+from pdf_extraction import MAX_PDF_BYTES, EncryptedPDFError, PDFExtractor, PDFWorkerError
+from similar_cases import MAX_K, SimilarCaseIndex
+from prediction_cache import PredictionCache, canonical_input
+from metrics import CONTENT_TYPE, REGISTRY, STAGE_SECONDS, CallbackMetric, MetricsMiddleware, render, timed
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = Path() / 'uploads'
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-app = FastAPI()
+training_scheduler = TrainingScheduler(registry)
+pdf_extractor = PDFExtractor()
+case_index = SimilarCaseIndex(registry.dataset_cache)
+prediction_cache = PredictionCache()
+
+def warm_up():
+    """Train once per process; requests only run inference on the published models"""
+    try:
+        registry.load()
+        case_index.refresh()
+    except Exception as e:
+        # Requests retry the build through registry.current()
+        logger.error(f"Initial model build failed: {str(e)}")
+    registry.on_stale = training_scheduler.notify_source_changed
+
+warmup_task = None
+
+async def wait_for_warmup():
+    if warmup_task is not None and not warmup_task.done():
+        await asyncio.shield(warmup_task)
+
+async def current_models():
+    """The served snapshot, waiting for the startup build if it is still running"""
+    await wait_for_warmup()
+    if registry.loaded:
+        return registry.current()
+    return await asyncio.to_thread(registry.current)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global warmup_task
+    # Models and the LLM proxy come up in the background so the server accepts
+    # connections right away; requests that need them wait until they are ready
+    warmup_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    proxy_task = asyncio.create_task(proxy.ensure_ready())
+    yield
+    await asyncio.gather(warmup_task, proxy_task, return_exceptions=True)
+    training_scheduler.shutdown()
+    pdf_extractor.shutdown()
+    await llm_client.aclose()
+    await asyncio.to_thread(proxy.shutdown)
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173", "https://health-vault-1.onrender.com"],
@@ -24,9 +76,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-async def analyze_medical_text(text):
-    system_prompt = """You are a medical report analyzer. Analyze the given medical report text and provide a JSON response in this format:
+ANALYSIS_SYSTEM_PROMPT = """You are a medical report analyzer. Analyze the given medical report text and provide a JSON response in this format:
     {
         "summary": "Very detailed information in layman terms bullet points, about 3 paragraphs 250 words",
         "findings": [
@@ -39,102 +91,364 @@ async def analyze_medical_text(text):
             {"emoji": "emoji", "title": "title", "description": "detailed description"}
         ]
     }"""
+ANALYSIS_QUERY = "Analyze this medical report and return only the JSON response:\n\n{text}"
+ANALYSIS_CHUNK_QUERY = ("This is part {part} of {parts} of a long medical report. Analyze this part "
+                        "and return only the JSON response:\n\n{text}")
+# Cached analyses are only reused for the prompt and schema that produced them
+PROMPT_VERSION = hashlib.sha256(
+    (ANALYSIS_SYSTEM_PROMPT + ANALYSIS_QUERY + ANALYSIS_CHUNK_QUERY
+     + json.dumps(ReportAnalysis.model_json_schema(), sort_keys=True)).encode()
+).hexdigest()[:12]
+# Chunks of one report analyzed at once, so a single long report can't take every LLM slot
+ANALYSIS_CHUNK_CONCURRENCY = int(os.getenv('ANALYSIS_CHUNK_CONCURRENCY', '3'))
+# The only fields of another patient's record /similar-cases returns; names
+# and dates of birth stay private
+CASE_FIELDS = ('Gender', 'Symptoms', 'Causes', 'Disease', 'Medicine')
+
+analysis_cache = AnalysisCache()
+
+def cache_lookup_counts():
+    counts = {}
+    for cache, stats in (('analysis', analysis_cache.stats()), ('pdf_pages', pdf_extractor.page_cache.stats())):
+        counts[(cache, 'memory_hit')] = stats['memory_hits']
+        counts[(cache, 'disk_hit')] = stats['disk_hits']
+        counts[(cache, 'miss')] = stats['misses']
+    stats = prediction_cache.stats()
+    counts[('prediction', 'hit')] = stats['hits']
+    counts[('prediction', 'miss')] = stats['misses']
+    return counts
+
+def cache_entry_counts():
+    return {
+        ('analysis',): analysis_cache.stats()['memory_entries'],
+        ('pdf_pages',): pdf_extractor.page_cache.stats()['memory_entries'],
+        ('prediction',): prediction_cache.stats()['entries']
+    }
+
+REGISTRY.register(CallbackMetric('mediai_cache_lookups_total', 'Cache lookups by cache and result',
+                                 'counter', cache_lookup_counts, ('cache', 'result')))
+REGISTRY.register(CallbackMetric('mediai_cache_entries', 'Entries held in memory per cache',
+                                 'gauge', cache_entry_counts, ('cache',)))
+
+async def analyze_long_report(chunks):
+    """Analyze report chunks concurrently and merge them into one analysis.
+
+    Returns the merged analysis and whether every chunk produced a valid one;
+    raises AnalysisError if none did.
+    """
+    semaphore = asyncio.Semaphore(ANALYSIS_CHUNK_CONCURRENCY)
+
+    async def analyze_chunk(part, chunk):
+        query = ANALYSIS_CHUNK_QUERY.format(part=part, parts=len(chunks), text=chunk)
+        async with semaphore:
+            raw_analysis = await aquery_claude(query, ANALYSIS_SYSTEM_PROMPT)
+        try:
+            with timed('analysis_parse'):
+                return parse_analysis(raw_analysis).model_dump()
+        except AnalysisError as e:
+            logger.error(f"Report chunk {part} of {len(chunks)}: {str(e)}")
+            return None
+
+    results = await asyncio.gather(*(analyze_chunk(i + 1, chunk) for i, chunk in enumerate(chunks)))
+    analyses = [analysis for analysis in results if analysis is not None]
+    if not analyses:
+        raise AnalysisError(f"None of the {len(chunks)} report chunks returned a valid analysis")
+    return merge_analyses(analyses), len(analyses) == len(chunks)
+
+async def analyze_medical_text(text):
+    """Structured analysis of a report's text; raises AnalysisError on malformed LLM output"""
+    cache_key = text_key(text, PROMPT_VERSION)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached['analysis']
+
+    chunks = split_report(text)
+    if len(chunks) > 1:
+        logger.info(f"Analyzing long report in {len(chunks)} chunks")
+        analysis, complete = await analyze_long_report(chunks)
+        if complete:
+            analysis_cache.put(cache_key, {'analysis': analysis})
+        return analysis
 
-    query = f"Analyze this medical report and return only the JSON response:\n\n{text}"
-    
+    raw_analysis = await aquery_claude(ANALYSIS_QUERY.format(text=text), ANALYSIS_SYSTEM_PROMPT)
+    logger.debug(f"Raw LLM response: {raw_analysis}")
+    with timed('analysis_parse'):
+        analysis = parse_analysis(raw_analysis).model_dump()
+    analysis_cache.put(cache_key, {'analysis': analysis})
+    return analysis
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_medical_analysis(filename, extraction, started):
+    """Server-sent events for /upload?stream=true.
+
+    Sends the extraction (text and page counts) first, then every analysis token as the LLM
+    produces it and each top-level section of the JSON once it is complete
+    and validated, and finally the whole analysis in a done event. The LLM
+    stream is closed as soon as a JSON object holding a valid analysis ends.
+    If an object turns out not to be the analysis (a brace in leading prose),
+    a reset event tells the client to drop the sections sent so far and the
+    scan resumes after it.
+    """
+    yield sse_event("text", {"filename": filename, **extraction})
+    text_content = extraction['text_content']
+    elapsed = time.perf_counter() - started
+    STAGE_SECONDS.observe(elapsed, stage='stream_first_byte')
+    logger.info(f"Time to first byte for {filename}: {elapsed * 1000:.0f} ms")
+
+    cache_key = text_key(text_content, PROMPT_VERSION)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        for name, value in cached['analysis'].items():
+            yield sse_event("section", {"name": name, "value": value})
+        yield sse_event("done", {"analysis": cached['analysis']})
+        return
+
+    if len(split_report(text_content)) > 1:
+        # Chunks are analyzed concurrently, so there is no single token stream to relay
+        try:
+            analysis = await analyze_medical_text(text_content)
+        except Exception as e:
+            logger.error(f"Error in LLM analysis: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+            return
+        for name, value in analysis.items():
+            yield sse_event("section", {"name": name, "value": value})
+        yield sse_event("done", {"analysis": analysis})
+        return
+
+    scanner = JSONSectionScanner()
+    sections = {}
+    tokens = []
+    analysis = None
     try:
-        raw_analysis = query_claude(query, system_prompt)
-        logger.info(f"Raw LLM response: {raw_analysis}")  # Log the raw response
-        
-        # Try different regex patterns
-        json_match = re.search(r'({[\s\S]*})', raw_analysis)
-        if json_match:
-            json_str = json_match.group(1)
-            # Validate JSON
-            try:
-                json.loads(json_str)  # Test if it's valid JSON
-                print("\n\n\nGOING TO SEND THE JSON\n\n\n")
-                return json_str
-            except json.JSONDecodeError as e:
-                logger.error(f"Invalid JSON: {e}")
-                return raw_analysis  # Return raw response if JSON is invalid
-        else:
-            logger.error("No JSON found in response")
-            return raw_analysis  # Return raw response if no JSON found
-            
+        query = ANALYSIS_QUERY.format(text=text_content)
+        async with aclosing(llm_client.stream(query, ANALYSIS_SYSTEM_PROMPT)) as stream:
+            async for token in stream:
+                if not tokens:
+                    elapsed = time.perf_counter() - started
+                    STAGE_SECONDS.observe(elapsed, stage='stream_first_token')
+                    logger.info(f"Time to first token for {filename}: {elapsed * 1000:.0f} ms")
+                tokens.append(token)
+                yield sse_event("token", {"text": token})
+                pending = token
+                while pending:
+                    for name, value in scanner.feed(pending):
+                        try:
+                            sections[name] = validate_section(name, value)
+                        except AnalysisError as e:
+                            logger.debug(f"Skipping streamed section: {str(e)}")
+                            continue
+                        yield sse_event("section", {"name": name, "value": sections[name]})
+                    pending = ''
+                    if scanner.done:
+                        try:
+                            analysis = ReportAnalysis.model_validate(sections).model_dump()
+                        except ValidationError:
+                            # The scanner latched onto a brace in leading prose; scan on from its end
+                            pending = scanner.buffer[scanner.end:]
+                            scanner = JSONSectionScanner()
+                            sections = {}
+                            yield sse_event("reset", {})
+                if analysis is not None:
+                    break
+
+        if analysis is None:
+            # No streamed object was a valid analysis; search the whole response
+            analysis = parse_analysis("".join(tokens)).model_dump()
     except Exception as e:
-        logger.error(f"Error in LLM analysis: {str(e)}")
-        return str(e)
+        logger.error(f"Error in LLM analysis stream: {str(e)}")
+        yield sse_event("error", {"detail": str(e)})
+        return
+
+    analysis_cache.put(cache_key, {'analysis': analysis})
+    yield sse_event("done", {"analysis": analysis})
+
+def format_prediction(advanced_prediction, diseases, medicines):
+    """Shape both predictors' output for one patient into the API response"""
+    return {
+        "advanced_prediction": {
+            "disease": {
+                "name": advanced_prediction.get('disease', {}).get('name', 'Unknown'),
+                "confidence": round(float(advanced_prediction.get('disease', {}).get('confidence', 0)), 2)
+            },
+            "medicine": {
+                "name": advanced_prediction.get('medicine', {}).get('name', 'Unknown'),
+                "confidence": round(float(advanced_prediction.get('medicine', {}).get('confidence', 0)), 2)
+            }
+        },
+        "basic_prediction": {
+            "diseases": [{"name": name, "confidence": round(float(conf), 2)} for name, conf in diseases],
+            "medicines": [{"name": name, "confidence": round(float(conf), 2)} for name, conf in medicines]
+        }
+    }
+
+def error_prediction(message):
+    """Structured prediction for a patient that couldn't be processed"""
+    return {
+        "advanced_prediction": {
+            "disease": {"name": "Error", "confidence": 0},
+            "medicine": {"name": "Error", "confidence": 0}
+        },
+        "basic_prediction": {
+            "diseases": [],
+            "medicines": []
+        },
+        "error": message
+    }
+
 @app.post("/predict-medical")
 async def predict_medical(data: dict):
     try:
-        # Advanced predictor
-        predictor2 = AdvancedMedicalPredictor('output.json')
+        # Both predictions come from the same snapshot so a concurrent retrain can't mix versions
+        snapshot = await current_models()
         
         # Convert age to int before passing to predictor
         age = int(data.get('age')) if data.get('age') else 0
         
-        advanced_prediction = predictor2.predict_single(
-            age=age,
-            gender=data.get('gender'),
-            symptoms=data.get('symptoms'),
-            cause=data.get('cause')
-        )
-        
-        # Basic predictor
-        training_data = load_training_data('output.json')
-        predictor = MedicalPredictor()
-        predictor.train(training_data)
-        
-        diseases, medicines = predictor.predict(
-            age,
-            data.get('gender'),
-            data.get('symptoms'),
-            data.get('cause')
-        )
+        # Advanced and basic predictor, or a cached result for an equivalent input
+        advanced_prediction, diseases, medicines = predict_rows(snapshot, [{
+            'age': age,
+            'gender': data.get('gender'),
+            'symptoms': data.get('symptoms'),
+            'cause': data.get('cause')
+        }])[0]
 
         # Format the response
-        response = {
-            "advanced_prediction": {
-                "disease": {
-                    "name": advanced_prediction.get('disease', {}).get('name', 'Unknown'),
-                    "confidence": round(float(advanced_prediction.get('disease', {}).get('confidence', 0)), 2)
-                },
-                "medicine": {
-                    "name": advanced_prediction.get('medicine', {}).get('name', 'Unknown'),
-                    "confidence": round(float(advanced_prediction.get('medicine', {}).get('confidence', 0)), 2)
-                }
-            },
-            "basic_prediction": {
-                "diseases": [{"name": name, "confidence": round(float(conf), 2)} for name, conf in diseases],
-                "medicines": [{"name": name, "confidence": round(float(conf), 2)} for name, conf in medicines]
-            },
-            "model_metrics": {
-                "disease_accuracy": 64.71,
-                "medicine_accuracy": 74.51
-            }
-        }
+        response = format_prediction(advanced_prediction, diseases, medicines)
+        response["model_metrics"] = snapshot.core.get_model_metrics()
         
         return response
         
     except Exception as e:
         logger.error(f"Error in medical prediction: {str(e)}")
         # Return a structured error response instead of raising an exception
-        return {
-            "advanced_prediction": {
-                "disease": {"name": "Error", "confidence": 0},
-                "medicine": {"name": "Error", "confidence": 0}
-            },
-            "basic_prediction": {
-                "diseases": [],
-                "medicines": []
-            },
-            "model_metrics": {
-                "disease_accuracy": 0,
-                "medicine_accuracy": 0
-            },
-            "error": str(e)
+        response = error_prediction(str(e))
+        response["model_metrics"] = {
+            "disease_accuracy": 0,
+            "medicine_accuracy": 0
         }
+        return response
+
+def predict_rows(snapshot, rows):
+    """(advanced, diseases, medicines) for each row, with repeats served from the prediction cache"""
+    version = snapshot.model_version
+    normalizer = snapshot.core.get_normalizer()
+    with timed('prediction_cache_key'):
+        keys = [canonical_input(normalizer, **row) for row in rows]
+    results = [prediction_cache.get(version, key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        batch = [rows[i] for i in missing]
+        for i, (advanced, (diseases, medicines)) in zip(missing, snapshot.predict_batch(batch)):
+            results[i] = (advanced, diseases, medicines)
+            if 'error' not in advanced:
+                prediction_cache.put(version, keys[i], results[i])
+    return results
+
+def predict_patients(snapshot, patients):
+    """Run both predictors over a batch of patients with one shared model pass.
+
+    Rows that aren't patient objects or have an unusable age get an
+    error_prediction; the rest of the batch is still predicted.
+    """
+    rows = []
+    errors = []
+    for patient in patients:
+        if not isinstance(patient, dict):
+            rows.append(None)
+            errors.append("Patient must be an object")
+            continue
+        invalid = [name for name in ('gender', 'symptoms', 'cause')
+                   if not isinstance(patient.get(name), (str, type(None)))]
+        if invalid:
+            rows.append(None)
+            errors.append(f"Invalid {invalid[0]}")
+            continue
+        # Convert age to int before passing to predictor
+        try:
+            age = int(patient.get('age')) if patient.get('age') else 0
+        except (TypeError, ValueError):
+            rows.append(None)
+            errors.append("Invalid age")
+            continue
+        rows.append({
+            'age': age,
+            'gender': patient.get('gender'),
+            'symptoms': patient.get('symptoms'),
+            'cause': patient.get('cause')
+        })
+        errors.append(None)
+
+    results = iter(predict_rows(snapshot, [row for row in rows if row is not None]))
+
+    predictions = []
+    for row, error in zip(rows, errors):
+        if row is None:
+            prediction = error_prediction(error)
+        else:
+            prediction = format_prediction(*next(results))
+        predictions.append(prediction)
+    return predictions
+
+@app.post("/predict-medical/batch")
+async def predict_medical_batch(data: dict):
+    patients = data.get('patients')
+    if not isinstance(patients, list):
+        raise HTTPException(status_code=400, detail="Expected a 'patients' list")
+
+    try:
+        snapshot = await current_models()
+        # Large batches are CPU bound, so keep them off the event loop
+        predictions = await asyncio.to_thread(predict_patients, snapshot, patients)
+    except Exception as e:
+        logger.error(f"Error in batch medical prediction: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "predictions": predictions,
+        "model_metrics": snapshot.core.get_model_metrics()
+    }
+
+@app.get("/model-metrics")
+async def model_metrics():
+    """Full evaluation of the served models: per-class and top-k scores"""
+    snapshot = await current_models()
+    return {
+        "model_version": snapshot.model_version,
+        "summary": snapshot.core.get_model_metrics(),
+        # None until the background cross-validation of this version finishes
+        "evaluation": snapshot.core.evaluation
+    }
+
+@app.get("/prediction-cache")
+async def prediction_cache_stats():
+    return prediction_cache.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(render(), media_type=CONTENT_TYPE)
+
+@app.post("/similar-cases")
+async def similar_cases(data: dict):
+    try:
+        k = min(int(data.get('k') or 5), MAX_K)
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        await wait_for_warmup()
+        matches = case_index.query(data.get('gender') or '', data.get('symptoms') or '',
+                                   data.get('cause') or '', k=k)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    records = await asyncio.to_thread(registry.store.get_many, [match['record_id'] for match in matches])
+    return {
+        "cases": [
+            {**match, "record": {field: records[match['record_id']].get(field) for field in CASE_FIELDS}}
+            for match in matches if match['record_id'] in records
+        ]
+    }
 
 @app.post("/upload-excel")
 async def upload_excel(file: UploadFile):
@@ -147,57 +461,115 @@ async def upload_excel(file: UploadFile):
         with open(f"uploads/{file.filename}", "wb") as f:
             f.write(contents)
         
-        df = pd.read_excel(f"uploads/{file.filename}")
-        
-        # Clean the data
-        cleaned_data = clean_excel_data(df)
+        # Clean the data chunk by chunk and append it to the record store; pandas
+        # is only imported the first time a spreadsheet is uploaded
+        from data_cleaner import ingest_excel
+        stats = await asyncio.to_thread(ingest_excel, f"uploads/{file.filename}", registry.store)
+        records_added = stats['records_added']
+
+        # Only the new rows are compiled and indexed, so they are searchable right away
+        await asyncio.to_thread(case_index.refresh)
         
-        # Update the JSON file
-        records_added = update_json_data(cleaned_data)
+        # Retrain in the background; the new models are swapped in once fully built
+        job = training_scheduler.request_retrain()
         
         return {
             "message": "Excel file processed successfully",
             "records_added": records_added,
-            "filename": file.filename
+            "rows_per_second": stats['rows_per_second'],
+            "ingest_seconds": stats['seconds'],
+            "filename": file.filename,
+            "training_job": job.to_dict()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/training-jobs")
+async def list_training_jobs():
+    return {
+        "model_version": (await current_models()).model_version,
+        "jobs": [job.to_dict() for job in training_scheduler.recent_jobs()]
+    }
+
+@app.get("/training-jobs/{job_id}")
+async def get_training_job(job_id: str):
+    job = training_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job.to_dict()
+
+@app.get("/analysis-cache")
+async def analysis_cache_stats():
+    return analysis_cache.stats()
+
 @app.post("/upload")
-async def upload_report(file_upload: UploadFile):
+async def upload_report(file_upload: UploadFile, stream: bool = False):
+    started = time.perf_counter()
     try:
         logger.info(f"Received file: {file_upload.filename}")
         
         if not file_upload.filename.endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are accepted")
         
-        data = await file_upload.read()
+        with timed('upload_read'):
+            data = await file_upload.read(MAX_PDF_BYTES + 1)
+        if len(data) > MAX_PDF_BYTES:
+            raise HTTPException(status_code=413, detail=f"PDF exceeds {MAX_PDF_BYTES} bytes")
         logger.info(f"File size: {len(data)} bytes")
 
         save_to = UPLOAD_DIR / file_upload.filename
-        with open(save_to, 'wb') as f:
+        with timed('upload_write'), open(save_to, 'wb') as f:
             f.write(data)
         logger.info(f"File saved to {save_to}")
 
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
-        
-        if pdf_reader.is_encrypted:
-            raise HTTPException(status_code=400, detail="Cannot process encrypted PDF")
+        # A re-uploaded PDF skips extraction; its text then hits the analysis cache
+        extraction_key = pdf_key(data)
+        extracted = analysis_cache.get(extraction_key)
+        if extracted is not None:
+            logger.info("Reusing cached text for previously uploaded PDF")
+        else:
+            try:
+                with timed('pdf_extract'):
+                    pdf_text = await pdf_extractor.extract_text(data)
+            except EncryptedPDFError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except PDFWorkerError as e:
+                raise HTTPException(status_code=503, detail=str(e))
 
-        text_content = ""
-        for page in pdf_reader.pages:
-            text_content += page.extract_text()
-        
-        logger.info("Successfully extracted text from PDF")
+            logger.info("Successfully extracted text from PDF")
+            extracted = {
+                'text_content': pdf_text.text,
+                'pages_extracted': pdf_text.pages,
+                'total_pages': pdf_text.total_pages,
+                'truncated': pdf_text.truncated,
+            }
+            analysis_cache.put(extraction_key, extracted)
+        text_content = extracted['text_content']
+
+        if stream:
+            return StreamingResponse(
+                stream_medical_analysis(file_upload.filename, extracted, started),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
-        analysis = await analyze_medical_text(text_content)
+        with timed('analysis'):
+            analysis = await analyze_medical_text(text_content)
         
         return {
             "filename": file_upload.filename,
-            "text_content": text_content,
+            **extracted,
             "analysis": analysis
         }
 
+    except HTTPException:
+        raise
+    except AnalysisError as e:
+        logger.error(f"Malformed LLM analysis: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing file: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
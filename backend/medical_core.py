@@ -0,0 +1,270 @@
+import logging
+import numpy as np
+import scipy.sparse as sp
+from collections import Counter
+from sklearn.preprocessing import LabelEncoder, MultiLabelBinarizer
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+from model_artifacts import ARTIFACT_DIR, artifact_key, chain_digest, load_artifacts, save_artifacts
+from dataset_cache import CompiledDataset, clean_record, safe_split
+from decoding import multioutput_confidence
+from estimators import (make_disease_classifier, make_medicine_classifier, medicine_classes,
+                        training_parallelism)
+from features import (make_symptom_encoder, make_cause_encoder, make_normalizer,
+                      encode_symptoms, encode_causes, assemble_features)
+from normalization import InputNormalizer, derive_synonyms
+from evaluation import EVAL_FOLDS, cross_validate, evaluation_folds, summary
+from metrics import PREDICTIONS, timed
+
+logger = logging.getLogger(__name__)
+
+
+class ModelScores(NamedTuple):
+    """Raw model output for a batch of patients, one row per patient"""
+    disease_probs: np.ndarray
+    # Probability of each medicine output's predicted class, and whether that class is 1
+    medicine_confidence: np.ndarray
+    medicine_recommended: np.ndarray
+
+
+class MedicalModelCore:
+    """Encoders and classifiers shared by the advanced and basic predictors.
+
+    The data is cleaned, encoded and fitted once; the predictors only differ
+    in how they validate inputs and decode the scores from predict_scores().
+    """
+
+    # Fitted state persisted to and restored from the artifact directory
+    ARTIFACT_ATTRS = ('disease_classifier', 'medicine_classifier', 'symptom_encoder',
+                      'disease_encoder', 'medicine_encoder', 'cause_encoder',
+                      'disease_accuracy', 'medicine_accuracy', 'record_synonyms')
+
+    def __init__(self, artifact_dir: Optional[str] = ARTIFACT_DIR):
+        """Fitted models are cached under artifact_dir keyed on the cleaned data and
+        hyperparameters; pass artifact_dir=None to always refit."""
+        self.artifact_dir = artifact_dir
+        self.model_version = None
+        self.disease_classifier = make_disease_classifier()
+        self.medicine_classifier = make_medicine_classifier()
+        self.symptom_encoder = make_symptom_encoder()
+        self.disease_encoder = LabelEncoder()
+        self.medicine_encoder = MultiLabelBinarizer()
+        self.cause_encoder = make_cause_encoder()
+        self.disease_accuracy = 0.0
+        self.medicine_accuracy = 0.0
+        # Variant spellings of symptoms and causes in the training data, onto their most common form
+        self.record_synonyms: Dict[str, Dict[str, str]] = {}
+        # Cross-validation report for model_version, once evaluate() has run
+        self.evaluation: Optional[Dict[str, Any]] = None
+        self.normalizer: Optional[InputNormalizer] = None
+
+    @staticmethod
+    def clean_data(data: Iterable[Dict]) -> List[Dict]:
+        """Clean and validate the training data"""
+        return [record for record in map(clean_record, data) if record is not None]
+
+    def prepare_features(self, data: List[Dict]) -> sp.csr_matrix:
+        """Prepare a sparse feature matrix from cleaned records"""
+        symptoms = [safe_split(record['Symptoms']) for record in data]
+        causes = [record['Causes'] for record in data]
+        ages = [record['Age'] for record in data]
+        genders = [1 if record['Gender'].startswith('M') else 0 for record in data]
+
+        X_symptoms = encode_symptoms(self.symptom_encoder, symptoms, fit=True)
+        X_causes = encode_causes(self.cause_encoder, causes, fit=True)
+        return assemble_features(ages, genders, X_symptoms, X_causes)
+
+    def prepare_targets(self, data: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Prepare target variables"""
+        diseases = [record['Disease'] for record in data]
+        medicines = [safe_split(record['Medicine']) for record in data]
+
+        y_diseases = self.disease_encoder.fit_transform(diseases)
+        y_medicines = self.medicine_encoder.fit_transform(medicines)
+        return y_diseases, y_medicines
+
+    @staticmethod
+    def derive_record_synonyms(data: Union[List[Dict], CompiledDataset]) -> Dict[str, Dict[str, str]]:
+        """Aliases for the symptom and cause spellings seen in cleaned records or a CompiledDataset"""
+        if isinstance(data, CompiledDataset):
+            counts = {name: data.label_counts(name) for name in ('symptoms', 'causes')}
+        else:
+            counts = {
+                'symptoms': Counter(symptom for record in data for symptom in safe_split(record['Symptoms'])),
+                'causes': Counter(record['Causes'] for record in data)
+            }
+        return {name: derive_synonyms(label_counts) for name, label_counts in counts.items()}
+
+    def fit_features(self, data: Union[List[Dict], CompiledDataset]) -> Tuple[sp.csr_matrix, np.ndarray, Any]:
+        """Fit the encoders on cleaned records or a CompiledDataset and return X and both targets"""
+        if isinstance(data, CompiledDataset):
+            return data.features_and_targets(
+                self.symptom_encoder, self.cause_encoder, self.disease_encoder, self.medicine_encoder
+            )
+        X = self.prepare_features(data)
+        y_diseases, y_medicines = self.prepare_targets(data)
+        return X, y_diseases, y_medicines
+
+    def train(self, training_data: Union[Iterable[Dict], CompiledDataset]) -> None:
+        """Train the models on raw records or a CompiledDataset"""
+        self.normalizer = None
+        self.evaluation = None
+        if isinstance(training_data, CompiledDataset):
+            if not len(training_data):
+                raise ValueError("No valid training data after cleaning")
+            logger.info(f"Using {len(training_data)} compiled records for training")
+            data_digest = training_data.data_digest
+        else:
+            logger.info("Cleaning and validating data...")
+            cleaned_data = self.clean_data(training_data)
+            if not cleaned_data:
+                raise ValueError("No valid training data after cleaning")
+            logger.info(f"Using {len(cleaned_data)} valid records for training")
+            data_digest = chain_digest(cleaned_data)
+
+        self.model_version = artifact_key(data_digest, self.estimators())
+        if self.load_version(self.model_version):
+            logger.info(f"Loaded trained models {self.model_version} from {self.artifact_dir}")
+            self._log_accuracies()
+            return
+
+        logger.info("Preparing features...")
+        with timed('train_features'):
+            X, y_diseases, y_medicines = self.fit_features(
+                training_data if isinstance(training_data, CompiledDataset) else cleaned_data
+            )
+
+        X_train, X_test, y_disease_train, y_disease_test, y_medicine_train, y_medicine_test = \
+            train_test_split(X, y_diseases, y_medicines, test_size=0.2, random_state=42)
+        self.record_synonyms = self.derive_record_synonyms(
+            training_data if isinstance(training_data, CompiledDataset) else cleaned_data
+        )
+
+        with training_parallelism(), timed('train_fit'):
+            logger.info("Training disease classifier...")
+            self.disease_classifier.fit(X_train, y_disease_train)
+            self.disease_accuracy = self.disease_classifier.score(X_test, y_disease_test)
+
+            logger.info("Training medicine classifier...")
+            self.medicine_classifier.fit(X_train, y_medicine_train)
+            self.medicine_accuracy = accuracy_score(y_medicine_test,
+                                                    self.medicine_classifier.predict(X_test))
+        self._log_accuracies()
+
+        with timed('artifact_save'):
+            save_artifacts(self.artifact_dir, self.model_version, 'core',
+                           {attr: getattr(self, attr) for attr in self.ARTIFACT_ATTRS})
+
+    def load_version(self, model_version: str) -> bool:
+        """Restore models saved by an earlier train(), e.g. in a training worker.
+
+        Returns False, leaving the core untouched, if that version isn't saved.
+        """
+        with timed('artifact_load'):
+            state = load_artifacts(self.artifact_dir, model_version, 'core')
+        if state is None:
+            return False
+        self._restore(state)
+        self.model_version = model_version
+        self.evaluation = None
+        return True
+
+    def _restore(self, state: Dict[str, Any]) -> None:
+        for attr in self.ARTIFACT_ATTRS:
+            # Artifacts saved before an attribute was added keep its default
+            if attr in state:
+                setattr(self, attr, state[attr])
+        self.normalizer = None
+
+    def evaluate(self, training_data: Union[List[Dict], CompiledDataset],
+                 n_splits: int = EVAL_FOLDS) -> Optional[Dict[str, Any]]:
+        """Cross-validate the model configuration on the data it was trained on.
+
+        The report is computed once per model version and fold count and kept
+        with the model artifacts. Returns None if there is too little data.
+        """
+        if self.model_version is None:
+            raise ValueError("Models must be trained before they are evaluated")
+        kind = f'evaluation-{n_splits}fold'
+        report = load_artifacts(self.artifact_dir, self.model_version, kind)
+        if report is None:
+            if not isinstance(training_data, CompiledDataset):
+                training_data = self.clean_data(training_data)
+            # Fresh encoders, so the served ones are left untouched
+            encoded = type(self)(artifact_dir=None)
+            X, y_diseases, y_medicines = encoded.fit_features(training_data)
+            n_splits = evaluation_folds(X.shape[0], n_splits)
+            if not n_splits:
+                return None
+            logger.info(f"Cross-validating models {self.model_version} with {n_splits} folds...")
+            with timed('evaluate'):
+                report = cross_validate(self.disease_classifier, self.medicine_classifier, X,
+                                        y_diseases, y_medicines, encoded.disease_encoder.classes_,
+                                        encoded.medicine_encoder.classes_, n_splits)
+            report['model_version'] = self.model_version
+            save_artifacts(self.artifact_dir, self.model_version, kind, report)
+        self.evaluation = report
+        return report
+
+    def get_model_metrics(self) -> Dict[str, Any]:
+        """Headline scores in percent: cross-validated once available, else the holdout split"""
+        if self.evaluation is not None:
+            return summary(self.evaluation)
+        return {**self.get_model_accuracies(), 'method': 'holdout'}
+
+    def _log_accuracies(self) -> None:
+        logger.info(f"Disease Classifier Accuracy: {self.disease_accuracy*100:.2f}%")
+        logger.info(f"Medicine Classifier Accuracy: {self.medicine_accuracy*100:.2f}%")
+
+    def estimators(self) -> Dict[str, Any]:
+        """Estimators whose hyperparameters are part of the artifact key"""
+        return {
+            'disease_classifier': self.disease_classifier,
+            'medicine_classifier': self.medicine_classifier,
+            'symptom_encoder': self.symptom_encoder,
+            'disease_encoder': self.disease_encoder,
+            'medicine_encoder': self.medicine_encoder,
+            'cause_encoder': self.cause_encoder
+        }
+
+    def get_model_accuracies(self) -> Dict[str, float]:
+        """Return the accuracy scores of the models"""
+        return {
+            'disease_accuracy': round(self.disease_accuracy * 100, 2),
+            'medicine_accuracy': round(self.medicine_accuracy * 100, 2)
+        }
+
+    def get_normalizer(self) -> InputNormalizer:
+        """Normalizer onto the classes the fitted encoders know"""
+        if self.normalizer is None:
+            self.normalizer = make_normalizer(self.symptom_encoder, self.cause_encoder, self.record_synonyms)
+        return self.normalizer
+
+    def build_features(self, ages: Sequence[int], genders: Sequence[Any], symptoms: Sequence[Any],
+                       causes: Sequence[Any]) -> sp.csr_matrix:
+        """Encode a batch of inputs with one transform call per encoder"""
+        normalizer = self.get_normalizer()
+        X_symptoms = encode_symptoms(self.symptom_encoder,
+                                     [normalizer.symptoms(safe_split(s)) for s in symptoms])
+        X_causes = encode_causes(self.cause_encoder, [normalizer.cause(cause) for cause in causes])
+        genders = [1 if str(gender).upper() == 'M' else 0 for gender in genders]
+        return assemble_features(ages, genders, X_symptoms, X_causes)
+
+    def predict_scores(self, patients: Sequence[Dict[str, Any]]) -> ModelScores:
+        """Score a batch of patient dicts with one predict_proba call per classifier"""
+        with timed('predict_features'):
+            X = self.build_features(
+                [patient['age'] for patient in patients],
+                [patient['gender'] for patient in patients],
+                [patient['symptoms'] for patient in patients],
+                [patient['cause'] for patient in patients]
+            )
+        with timed('predict_model'):
+            disease_probs = self.disease_classifier.predict_proba(X)
+            confidence, recommended = multioutput_confidence(
+                self.medicine_classifier.predict_proba(X), medicine_classes(self.medicine_classifier)
+            )
+        PREDICTIONS.inc(len(patients))
+        return ModelScores(disease_probs, confidence, recommended)
+
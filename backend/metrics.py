@@ -0,0 +1,235 @@
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Metrics live in the process that records them; with several uvicorn workers
+# each one exposes its own, which Prometheus tells apart by instance
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; wide enough for sub-millisecond inference and multi-minute training
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A named family of samples, one per combination of label values"""
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], LabelValues, float]]:
+        """(name suffix, label names, label values, value) for every sample"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        # Unlabelled metrics are exported as 0 before anything is recorded
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return (('', self.labelnames, key, value) for key, value in items)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def replace(self, value: float, **labels: str) -> None:
+        """Set one sample and drop every other, e.g. for the current model version"""
+        key = self._key(labels)
+        with self._lock:
+            self._values = {key: value}
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = entry
+            counts[index] += 1
+            total[0] += value
+
+    def time(self, **labels: str) -> '_Timer':
+        """Context manager observing the time spent inside it"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        bucket_names = self.labelnames + ('le',)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', bucket_names, key + (_format_value(bound),), cumulative
+            yield '_sum', self.labelnames, key, total
+            yield '_count', self.labelnames, key, cumulative
+
+
+class _Timer:
+    # A plain class rather than @contextmanager: it is entered on every request
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class CallbackMetric(Metric):
+    """Metric read from function() at scrape time, for values kept elsewhere.
+
+    function returns a plain value, or a dict from label values to values.
+    """
+
+    def __init__(self, name: str, help: str, type: str, function: Callable,
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.function = function
+
+    def samples(self):
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [('', self.labelnames, tuple(str(v) for v in key), value)
+                for key, value in values.items() if value is not None]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'mediai_stage_seconds', 'Time spent in each processing stage', ('stage',)))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'mediai_http_request_seconds', 'Time to the start of the response per route',
+    ('method', 'route', 'status')))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    'mediai_llm_requests_total', 'LLM proxy calls by outcome', ('outcome',)))
+RECORDS_INGESTED = REGISTRY.register(Counter(
+    'mediai_records_ingested_total', 'Patient records appended from Excel uploads'))
+PREDICTIONS = REGISTRY.register(Counter(
+    'mediai_predictions_total', 'Patients run through the models'))
+MODEL_INFO = REGISTRY.register(Gauge(
+    'mediai_model_info', 'Version of the models currently served', ('version',)))
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request up to its response headers"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+
+        async def send_and_time(message):
+            if message['type'] == 'http.response.start':
+                # Label by route template rather than raw path to keep cardinality bounded
+                route = scope.get('route')
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, method=scope['method'],
+                    route=getattr(route, 'path', 'unmatched'), status=str(message['status']))
+            await send(message)
+
+        await self.app(scope, receive, send_and_time)
+
+
+def timed(stage: str):
+    """Record the time spent in a with block under mediai_stage_seconds{stage=...}"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,85 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+KEEP_VERSIONS = int(os.getenv('MODEL_ARTIFACT_KEEP', '5'))
+
+
+def chain_digest(cleaned_data: Iterable[Dict], digest: bytes = b'') -> bytes:
+    """Fold cleaned records into a running hash one record at a time.
+
+    Continuing from a previous digest with newly appended records gives the
+    same result as hashing every record in one pass, so incremental datasets
+    and full reloads agree on the data version.
+    """
+    for record in cleaned_data:
+        digest = hashlib.sha256(digest + json.dumps(record, sort_keys=True).encode()).digest()
+    return digest
+
+
+def artifact_key(data_digest: bytes, estimators: Dict[str, Any]) -> str:
+    """Hash the training data digest together with every estimator's parameters"""
+    digest = hashlib.sha256()
+    for name in sorted(estimators):
+        estimator = estimators[name]
+        params = {'class': type(estimator).__name__, 'params': estimator.get_params()}
+        digest.update(name.encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    digest.update(data_digest)
+    return digest.hexdigest()[:24]
+
+
+def load_artifacts(artifact_dir: Optional[str], key: str, kind: str) -> Optional[Dict[str, Any]]:
+    """Load a fitted model bundle, or None if this version was never saved"""
+    if not artifact_dir:
+        return None
+    path = os.path.join(artifact_dir, key, f"{kind}.joblib")
+    if not os.path.exists(path):
+        return None
+    import joblib  # only needed once models are built, not at API startup
+
+    try:
+        return joblib.load(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable model artifact {path}: {str(e)}")
+        return None
+
+
+def save_artifacts(artifact_dir: Optional[str], key: str, kind: str, state: Dict[str, Any]) -> None:
+    """Write a fitted model bundle atomically so readers never see a partial file"""
+    if not artifact_dir:
+        return
+    import joblib
+
+    version_dir = os.path.join(artifact_dir, key)
+    os.makedirs(version_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=version_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            joblib.dump(state, f)
+        os.replace(tmp_path, os.path.join(version_dir, f"{kind}.joblib"))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _prune_versions(artifact_dir, keep=key)
+
+
+def _prune_versions(artifact_dir: str, keep: str) -> None:
+    """Remove all but the most recently written model versions"""
+    try:
+        versions = [os.path.join(artifact_dir, name) for name in os.listdir(artifact_dir)]
+    except OSError:
+        return
+    versions = [path for path in versions if os.path.isdir(path)]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[KEEP_VERSIONS:]:
+        if os.path.basename(path) != keep:
+            shutil.rmtree(path, ignore_errors=True)
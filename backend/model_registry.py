@@ -0,0 +1,212 @@
+import os
+import threading
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+from model_artifacts import ARTIFACT_DIR
+from record_store import RecordStore
+from dataset_cache import DATASET_DIR, CompiledDataset, DatasetCache
+from metrics import MODEL_INFO, timed
+
+if TYPE_CHECKING:
+    from medical_core import MedicalModelCore
+    from medical_recommender import AdvancedMedicalPredictor
+    from medical_predictor import MedicalPredictor
+
+logger = logging.getLogger(__name__)
+
+# 'full' refits every model on all records; 'incremental' updates the previous
+# models with only the new records and refits them periodically
+TRAINING_MODE = os.getenv('TRAINING_MODE', 'full')
+TRAINING_MODES = ('full', 'incremental')
+
+
+def make_model_core(artifact_dir: Optional[str], mode: str = TRAINING_MODE) -> 'MedicalModelCore':
+    # sklearn is imported here rather than at startup, so the API can
+    # start serving before the first build
+    if mode == 'incremental':
+        from incremental import IncrementalModelCore
+        return IncrementalModelCore(artifact_dir)
+    if mode == 'full':
+        from medical_core import MedicalModelCore
+        return MedicalModelCore(artifact_dir)
+    raise ValueError(f"Unknown TRAINING_MODE {mode!r}; expected one of {TRAINING_MODES}")
+
+
+class ModelSnapshot:
+    """Immutable bundle of trained predictors served to requests.
+
+    Both predictors are views over one shared core, so the models are fitted
+    once and predict_batch() scores each patient once for both of them.
+    """
+
+    def __init__(self, core: 'MedicalModelCore', source_version: int, dataset: Optional[CompiledDataset] = None):
+        from medical_recommender import AdvancedMedicalPredictor
+        from medical_predictor import MedicalPredictor
+
+        self.core = core
+        # What the core was trained on, kept for evaluating it
+        self.dataset = dataset
+        self.advanced = AdvancedMedicalPredictor(core=core)
+        self.basic = MedicalPredictor(core=core)
+        self.source_version = source_version
+
+    @property
+    def model_version(self) -> Optional[str]:
+        return self.core.model_version
+
+    def predict_batch(self, patients: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Tuple[List, List]]]:
+        """(advanced, (diseases, medicines)) for each patient, in input order.
+
+        Each view keeps its own validation: rows only the basic predictor
+        accepts still get basic predictions, and vice versa.
+        """
+        advanced_errors = [self.advanced.validation_error(patient) for patient in patients]
+        basic_accepted = [self.basic.accepts(patient) for patient in patients]
+        scored_rows = [row for row in range(len(patients))
+                       if advanced_errors[row] is None or basic_accepted[row]]
+        advanced: List[Dict[str, Any]] = [{'error': error} for error in advanced_errors]
+        basic: List[Tuple[List, List]] = [([], []) for _ in patients]
+
+        if scored_rows:
+            scores = self.core.predict_scores([patients[row] for row in scored_rows])
+            for row, advanced_prediction, basic_prediction in zip(
+                    scored_rows, self.advanced.decode(scores), self.basic.decode(scores)):
+                if advanced_errors[row] is None:
+                    advanced[row] = advanced_prediction
+                if basic_accepted[row]:
+                    basic[row] = basic_prediction
+        return list(zip(advanced, basic))
+
+
+class ModelRegistry:
+    """Process-wide holder of the trained predictors.
+
+    Models are built once and requests only run inference against the current
+    snapshot. Rebuilds happen off to the side and the snapshot reference is
+    swapped in a single assignment, so in-flight requests keep using the
+    models they started with. Each published snapshot is then cross-validated
+    in the background unless evaluate is False.
+    """
+
+    def __init__(self, store: RecordStore, artifact_dir: Optional[str] = ARTIFACT_DIR,
+                 dataset_dir: str = DATASET_DIR, evaluate: bool = True):
+        self.store = store
+        self.evaluate = evaluate
+        self.artifact_dir = artifact_dir
+        self.dataset_cache = DatasetCache(store, dataset_dir)
+        # Called instead of the built-in background rebuild when new records arrive
+        self.on_stale: Optional[Callable[[], None]] = None
+        self._snapshot: Optional[ModelSnapshot] = None
+        self._build_lock = threading.Lock()
+        self._evaluate_lock = threading.Lock()
+
+    def source_version(self) -> int:
+        """Version of the training data, used to detect new records"""
+        return self.store.last_id()
+
+    def _build(self) -> ModelSnapshot:
+        """Train the shared models on the current contents of the record store"""
+        source_version = self.source_version()
+
+        # Only records added since the last build are cleaned and encoded
+        with timed('dataset_compile'):
+            dataset = self.dataset_cache.refresh()
+
+        core = make_model_core(self.artifact_dir)
+        core.train(dataset)
+
+        return ModelSnapshot(core, source_version, dataset)
+
+    def load(self) -> ModelSnapshot:
+        """Build the models and publish them as the current snapshot"""
+        with self._build_lock:
+            snapshot = self._build()
+            self._publish(snapshot)
+            logger.info(f"Published models trained on {self.store.path}")
+            return snapshot
+
+    def load_trained(self, model_version: str, source_version: int, data_digest: Optional[str] = None) -> ModelSnapshot:
+        """Publish models a training worker has already fitted and saved.
+
+        Loads exactly that version rather than building from the store, so
+        records added while the worker trained are left for the next job
+        instead of being fitted here in the server process.
+        """
+        with self._build_lock:
+            core = make_model_core(self.artifact_dir)
+            if not core.load_version(model_version):
+                raise RuntimeError(f"Trained models {model_version} are missing from {self.artifact_dir}")
+            # The compiled dataset is only kept for evaluation if it is still the one trained on
+            dataset = self.dataset_cache.load()
+            if data_digest is None or dataset.data_digest.hex() != data_digest:
+                dataset = None
+            snapshot = ModelSnapshot(core, source_version, dataset)
+            self._publish(snapshot)
+            logger.info(f"Published models {model_version} trained on {self.store.path}")
+            return snapshot
+
+    @property
+    def loaded(self) -> bool:
+        """Whether a snapshot has been published and current() won't block"""
+        return self._snapshot is not None
+
+    def refresh_if_changed(self) -> bool:
+        """Rebuild the models if records were added since the last build"""
+        current = self._snapshot
+        if current is not None and current.source_version == self.source_version():
+            return False
+        with self._build_lock:
+            # Another caller may have rebuilt while we waited for the lock
+            current = self._snapshot
+            if current is not None and current.source_version == self.source_version():
+                return False
+            snapshot = self._build()
+            self._publish(snapshot)
+            logger.info(f"Published models retrained on updated {self.store.path}")
+            return True
+
+    def _publish(self, snapshot: ModelSnapshot) -> None:
+        self._snapshot = snapshot
+        MODEL_INFO.replace(1, version=snapshot.model_version or '')
+        if self.evaluate:
+            threading.Thread(target=self._evaluate, args=(snapshot,), daemon=True).start()
+
+    def _evaluate(self, snapshot: ModelSnapshot) -> None:
+        """Attach cross-validated metrics to a published snapshot"""
+        # One evaluation at a time; a snapshot replaced while waiting is skipped
+        with self._evaluate_lock:
+            if self._snapshot is not snapshot or snapshot.dataset is None:
+                return
+            try:
+                snapshot.core.evaluate(snapshot.dataset)
+            except Exception as e:
+                logger.error(f"Evaluating models {snapshot.model_version} failed: {str(e)}")
+
+    def _refresh_in_background(self) -> None:
+        if self._build_lock.locked():
+            return
+        threading.Thread(target=self.refresh_if_changed, daemon=True).start()
+
+    def current(self) -> ModelSnapshot:
+        """Return the snapshot to serve a request with.
+
+        If records were added by another worker or process, a rebuild is
+        started in the background and the existing models keep serving until it finishes.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh_if_changed()
+            return self._snapshot
+        if snapshot.source_version != self.source_version():
+            if self.on_stale is not None:
+                self.on_stale()
+            else:
+                self._refresh_in_background()
+        return snapshot
+
+    def predictors(self) -> Tuple['AdvancedMedicalPredictor', 'MedicalPredictor']:
+        snapshot = self.current()
+        return snapshot.advanced, snapshot.basic
+
+
+registry = ModelRegistry(RecordStore())
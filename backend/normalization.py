@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import logging
+from collections import defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Minimum similarity (difflib ratio) for a fuzzy match
+FUZZY_THRESHOLD = float(os.getenv('NORMALIZATION_FUZZY_THRESHOLD', '0.75'))
+# Minimum similarity for a rarer label in the training records to be taken as
+# a variant spelling of a more common one (e.g. truncated or mistyped entries)
+RECORD_ALIAS_THRESHOLD = float(os.getenv('NORMALIZATION_RECORD_ALIAS_THRESHOLD', '0.85'))
+# Optional JSON file of extra {"symptoms": {alias: name}, "causes": {alias: name}}
+SYNONYMS_FILE = os.getenv('NORMALIZATION_SYNONYMS_FILE', '')
+CACHE_SIZE = 4096
+
+# Aliases come from three places:
+#   - this built-in table of common lay terms and abbreviations,
+#   - NORMALIZATION_SYNONYMS_FILE, which extends and overrides the table,
+#   - derive_synonyms(), run on the training records, which maps the variant
+#     spellings and case/spacing forms of each label onto its most common form.
+# An alias is only used when its target is a class the models were trained on.
+SYNONYMS = {
+    'symptoms': {
+        'temperature': 'Fever',
+        'high temperature': 'Fever',
+        'pyrexia': 'Fever',
+        'tiredness': 'Fatigue',
+        'tired': 'Fatigue',
+        'exhaustion': 'Fatigue',
+        'sob': 'Shortness of breath',
+        'breathlessness': 'Shortness of breath',
+        'difficulty breathing': 'Shortness of breath',
+        'throwing up': 'Vomiting',
+        'stomach ache': 'Stomach Pain',
+        'stomachache': 'Stomach Pain',
+        'tummy ache': 'Stomach Pain',
+        'belly pain': 'Abdominal Pain',
+        'head ache': 'Headache',
+        'rash': 'Skin Rash',
+        'palpitations': 'Rapid Heartbeat',
+        'loose motions': 'Diarrhea',
+        'diarrhoea': 'Diarrhea',
+        'sore joints': 'Joint Pain',
+        'dizzy': 'Dizziness',
+        'itchy': 'Itching',
+        'lightheadedness': 'Dizziness',
+    },
+    'causes': {
+        'virus': 'Viral Infection',
+        'viral': 'Viral Infection',
+        'flu': 'Viral Infection',
+        'bacteria': 'Bacterial Infection',
+        'bacterial': 'Bacterial Infection',
+        'allergy': 'Allergies',
+        'hypertension': 'High Blood Pressure',
+        'high bp': 'High Blood Pressure',
+        'bad food': 'Food Poisoning',
+        'stressed': 'Stress',
+    },
+}
+
+
+def canonical(text: str) -> str:
+    """Lower-case text with punctuation removed and whitespace collapsed"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', str(text).casefold()).split())
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _closest(key: str, keys: List[str], candidates: Iterable[int], threshold: float) -> Optional[int]:
+    """Index into keys of the candidate most similar to key, if any reaches threshold"""
+    best, best_score = None, threshold
+    matcher = SequenceMatcher(None, b=key)
+    for label_id in sorted(candidates):
+        matcher.set_seq1(keys[label_id])
+        # The quick ratios are cheap upper bounds on ratio()
+        if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+            continue
+        score = matcher.ratio()
+        if score > best_score or (best is None and score == best_score):
+            best, best_score = label_id, score
+    return best
+
+
+def derive_synonyms(label_counts: Dict[str, int], threshold: float = RECORD_ALIAS_THRESHOLD) -> Dict[str, str]:
+    """Aliases from each label seen in the training records onto its most common form.
+
+    label_counts holds how often each raw label occurs. Labels are visited
+    most common first; a label whose canonical form matches an earlier one's
+    once spaces are ignored ('Viral Infection   ', 'Shortnessof breath'), or
+    that is at least threshold similar to one ('Rheumatoid Arthriti'),
+    becomes an alias of it.
+    """
+    aliases: Dict[str, str] = {}
+    labels: List[str] = []
+    keys: List[str] = []
+    compact: Dict[str, str] = {}
+    postings: Dict[str, List[int]] = defaultdict(list)
+    # sorted() is stable, so equally common labels keep their first-seen order
+    for label, _ in sorted(label_counts.items(), key=lambda item: -item[1]):
+        key = canonical(label)
+        if not key:
+            continue
+        target = compact.get(key.replace(' ', ''))
+        if target is None:
+            candidates = {label_id for gram in _trigrams(key) for label_id in postings.get(gram, ())}
+            match = _closest(key, keys, candidates, threshold)
+            target = labels[match] if match is not None else None
+        if target is not None:
+            aliases[label] = target
+            continue
+        compact[key.replace(' ', '')] = label
+        for gram in _trigrams(key):
+            postings[gram].append(len(labels))
+        labels.append(label)
+        keys.append(key)
+    return aliases
+
+
+class VocabularyIndex:
+    """Maps free text onto one of a fixed set of class labels.
+
+    Tries, in order: the label itself, its canonical form (case, spacing and
+    punctuation ignored), a synonym table, then the most similar label among
+    those sharing a character trigram with the input, found through an
+    inverted trigram index. Lookups are memoized.
+
+    record_synonyms (from derive_synonyms) redirect variant labels to their
+    most common form at every step, including exact matches. sources maps
+    each alias's canonical form to where it came from: 'records' or 'table'.
+    """
+
+    def __init__(self, labels: Iterable[str], synonyms: Optional[Dict[str, str]] = None,
+                 threshold: float = FUZZY_THRESHOLD, record_synonyms: Optional[Dict[str, str]] = None):
+        self.labels = [str(label) for label in labels]
+        self.threshold = threshold
+        known = set(self.labels)
+        self._redirect = {alias: target for alias, target in (record_synonyms or {}).items()
+                          if alias in known and target in known}
+        self._exact = known - set(self._redirect)
+        self._canonical: Dict[str, str] = {}
+        self.sources: Dict[str, str] = {}
+        for label in self.labels:
+            key = canonical(label)
+            target = self._redirect.get(label, label)
+            if key not in self._canonical and canonical(target) != key:
+                self.sources[key] = 'records'
+            self._canonical.setdefault(key, target)
+        for alias, target in (synonyms or {}).items():
+            target = self._canonical.get(canonical(target))
+            if target is not None and canonical(alias) not in self._canonical:
+                self._canonical[canonical(alias)] = target
+                self.sources[canonical(alias)] = 'table'
+
+        self._keys = [canonical(label) for label in self.labels]
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for label_id, key in enumerate(self._keys):
+            for gram in _trigrams(key):
+                self._postings[gram].append(label_id)
+        self.lookup = lru_cache(maxsize=CACHE_SIZE)(self._lookup)
+
+    def _lookup(self, text: str) -> Optional[str]:
+        if text in self._exact:
+            return text
+        key = canonical(text)
+        if not key:
+            return None
+        match = self._canonical.get(key)
+        if match is not None:
+            return match
+        return self._fuzzy(key)
+
+    def _fuzzy(self, key: str) -> Optional[str]:
+        # Only labels sharing a trigram with the input are scored
+        candidates = set()
+        for gram in _trigrams(key):
+            candidates.update(self._postings.get(gram, ()))
+        best = _closest(key, self._keys, candidates, self.threshold)
+        if best is None:
+            return None
+        label = self.labels[best]
+        return self._redirect.get(label, label)
+
+
+class InputNormalizer:
+    """Normalizes request symptoms and causes to the classes the encoders know"""
+
+    def __init__(self, symptom_labels: Iterable[str], cause_labels: Iterable[str],
+                 synonyms: Optional[Dict[str, Dict[str, str]]] = None,
+                 record_synonyms: Optional[Dict[str, Dict[str, str]]] = None):
+        synonyms = synonyms if synonyms is not None else load_synonyms()
+        record_synonyms = record_synonyms or {}
+        self.symptom_index = VocabularyIndex(symptom_labels, synonyms.get('symptoms'),
+                                             record_synonyms=record_synonyms.get('symptoms'))
+        self.cause_index = VocabularyIndex(cause_labels, synonyms.get('causes'),
+                                           record_synonyms=record_synonyms.get('causes'))
+
+    def symptoms(self, symptoms: List[str]) -> List[str]:
+        """Known symptom classes for the given symptoms; unrecognised ones are dropped"""
+        normalized = []
+        for symptom in symptoms:
+            match = self.symptom_index.lookup(symptom)
+            if match is None:
+                logger.debug(f"Unrecognised symptom {symptom!r}")
+            elif match not in normalized:
+                normalized.append(match)
+        return normalized
+
+    def cause(self, cause: str) -> str:
+        """The known cause class for cause, or cause itself if nothing matches"""
+        match = self.cause_index.lookup(cause)
+        if match is None:
+            logger.debug(f"Unrecognised cause {cause!r}")
+            return cause
+        return match
+
+
+def load_synonyms(path: str = SYNONYMS_FILE) -> Dict[str, Dict[str, str]]:
+    """The built-in synonym table, extended from NORMALIZATION_SYNONYMS_FILE if set"""
+    synonyms = {name: dict(table) for name, table in SYNONYMS.items()}
+    if not path:
+        return synonyms
+    try:
+        with open(path, 'r') as f:
+            extra = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring synonyms file {path}: {str(e)}")
+        return synonyms
+    for name in synonyms:
+        synonyms[name].update(extra.get(name, {}))
+    return synonyms
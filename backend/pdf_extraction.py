@@ -0,0 +1,209 @@
+import io
+import os
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from analysis_cache import ANALYSIS_CACHE_DIR, AnalysisCache
+
+logger = logging.getLogger(__name__)
+
+MAX_PDF_BYTES = int(os.getenv('MAX_PDF_BYTES', str(50 * 1024 * 1024)))
+MAX_PDF_PAGES = int(os.getenv('MAX_PDF_PAGES', '500'))
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Fewer pages than this per worker and re-parsing the file costs more than it saves
+MIN_PAGES_PER_TASK = 8
+
+
+class EncryptedPDFError(ValueError):
+    pass
+
+
+class PDFWorkerError(RuntimeError):
+    """Raised when the extraction workers keep dying on a document"""
+
+
+class PDFText(NamedTuple):
+    """Text of a PDF and how much of the document it covers"""
+    text: str
+    pages: int
+    total_pages: int
+
+    @property
+    def truncated(self) -> bool:
+        """Whether pages past the page limit were left out"""
+        return self.pages < self.total_pages
+
+
+def _hash_object(obj, digest, seen: Dict[Tuple[int, int], Optional[bytes]]) -> None:
+    """Feed a canonical form of a PDF object into digest, following references.
+
+    Shared objects (fonts, form XObjects) are hashed once per document and
+    then stood in for by their hash. A reference back into an object still
+    being hashed is marked as a cycle, since its content is already covered.
+    """
+    from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in seen:
+            seen[key] = None
+            sub = hashlib.sha256()
+            _hash_object(obj.get_object(), sub, seen)
+            seen[key] = sub.digest()
+        digest.update(b'R' + (seen[key] or b'cycle'))
+    elif isinstance(obj, StreamObject):
+        digest.update(b'S')
+        _hash_dict(obj, digest, seen, skip={'/Length'})
+        # Images carry no extractable text; skipping their data keeps scanned
+        # PDFs cheap to key
+        if obj.get('/Subtype') != '/Image':
+            # The stored bytes, as decoding every stream would cost as much as
+            # extracting the text; /Filter is part of the hash instead
+            data = obj._data or b''
+            if isinstance(data, str):
+                data = data.encode('latin-1')
+            digest.update(len(data).to_bytes(8, 'big') + data)
+    elif isinstance(obj, DictionaryObject):
+        digest.update(b'D')
+        # /Parent would walk back up into the page tree
+        _hash_dict(obj, digest, seen, skip={'/Parent'})
+    elif isinstance(obj, ArrayObject):
+        digest.update(b'A%d' % len(obj))
+        for item in obj:
+            _hash_object(item, digest, seen)
+    else:
+        value = repr(obj).encode()
+        digest.update(type(obj).__name__.encode() + len(value).to_bytes(8, 'big') + value)
+
+
+def _hash_dict(obj, digest, seen, skip) -> None:
+    keys = sorted(key for key in obj if key not in skip)
+    digest.update(b'%d' % len(keys))
+    for key in keys:
+        digest.update(key.encode() + b'\0')
+        # Hash the stored value so references stay references rather than being resolved twice
+        _hash_object(obj.raw_get(key), digest, seen)
+
+
+def _page_digest(page, seen: Dict[Tuple[int, int], Optional[bytes]]) -> str:
+    """Hash of everything a page's text depends on.
+
+    The content stream alone is not enough: text drawn through a form
+    XObject (`/Fm1 Do`) or shown with a different font lives in the page's
+    resources, so two documents can share a content stream yet read
+    differently.
+    """
+    digest = hashlib.sha256()
+    # PyPDF2 copies inherited /Resources and /Rotate down onto each page
+    for key in ('/Contents', '/Resources', '/Rotate'):
+        digest.update(key.encode())
+        if key in page:
+            _hash_object(page.raw_get(key), digest, seen)
+    return digest.hexdigest()
+
+
+def scan_pages(data: bytes, max_pages: int) -> Optional[Tuple[List[str], int]]:
+    """Content hash of each page up to max_pages and the page count, or None if the PDF is encrypted"""
+    import PyPDF2  # imported in the worker processes only
+
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    if reader.is_encrypted:
+        return None
+    seen: Dict[Tuple[int, int], Optional[bytes]] = {}
+    return [_page_digest(page, seen) for page in reader.pages[:max_pages]], len(reader.pages)
+
+
+def extract_pages(data: bytes, indices: List[int]) -> List[str]:
+    """Text of the given pages; runs in a worker process"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    return [reader.pages[i].extract_text() for i in indices]
+
+
+class PDFExtractor:
+    """Extracts PDF text page by page in a pool of worker processes.
+
+    Pages are identified by a hash of their content stream and the resources
+    it draws with (fonts, form XObjects), and each page's text is cached, so
+    a re-uploaded document with a few changed pages only re-extracts those.
+    Documents over max_pages are truncated, which the result reports.
+    """
+
+    def __init__(self, workers: int = PDF_WORKERS, max_pages: int = MAX_PDF_PAGES,
+                 page_cache: Optional[AnalysisCache] = None):
+        self.workers = workers
+        self.max_pages = max_pages
+        self.page_cache = page_cache or AnalysisCache(os.path.join(ANALYSIS_CACHE_DIR, 'pages'))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn avoids forking a process that already runs server threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _reset_executor(self, broken: ProcessPoolExecutor) -> None:
+        # Concurrent requests see the same broken pool; only the first replaces it
+        if self._executor is broken:
+            self._executor = None
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        """Run fn in the pool, replacing the pool once if a worker died"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+                if attempt:
+                    raise PDFWorkerError("PDF extraction workers crashed")
+                logger.warning("PDF extraction worker died, restarting the pool")
+
+    async def extract_text(self, data: bytes) -> PDFText:
+        scanned = await self._run(scan_pages, data, self.max_pages)
+        if scanned is None:
+            raise EncryptedPDFError("Cannot process encrypted PDF")
+        digests, total_pages = scanned
+        if total_pages > len(digests):
+            logger.warning(f"PDF has {total_pages} pages; only the first {len(digests)} are extracted")
+
+        texts = await asyncio.to_thread(self._cached_pages, digests)
+        missing = [i for i, text in enumerate(texts) if text is None]
+        if missing:
+            tasks = max(1, min(self.workers, len(missing) // MIN_PAGES_PER_TASK))
+            batches = [missing[start::tasks] for start in range(tasks)]
+            results = await asyncio.gather(*(
+                self._run(extract_pages, data, batch) for batch in batches
+            ))
+            for batch, batch_texts in zip(batches, results):
+                for i, text in zip(batch, batch_texts):
+                    texts[i] = text
+            await asyncio.to_thread(self._store_pages, digests, texts, missing)
+
+        logger.info(f"Extracted {len(missing)} of {len(digests)} pages ({len(digests) - len(missing)} cached)")
+        return PDFText("".join(texts), len(digests), total_pages)
+
+    def _cached_pages(self, digests: List[str]) -> List[Optional[str]]:
+        texts = []
+        for digest in digests:
+            cached = self.page_cache.get(f"page-{digest}")
+            texts.append(cached['text'] if cached is not None else None)
+        return texts
+
+    def _store_pages(self, digests: List[str], texts: List[str], indices: List[int]) -> None:
+        for i in indices:
+            self.page_cache.put(f"page-{digests[i]}", {'text': texts[i]})
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,85 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from dataset_cache import safe_split
+from normalization import InputNormalizer
+
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '10000'))
+PREDICTION_CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+
+
+def canonical_input(normalizer: InputNormalizer, age: int, gender: Any, symptoms: Any, cause: Any) -> Tuple:
+    """Hashable form of one patient's input.
+
+    Inputs with the same form reach the encoders as the same symptom set and
+    cause, and pass or fail validation alike, so they get the same prediction.
+    """
+    split = safe_split(symptoms)
+    symptom_key = tuple(sorted(normalizer.symptoms(split)))
+    if isinstance(cause, str) and cause.strip():
+        # Unknown causes all encode to the same all-zero block
+        cause_key = normalizer.cause_index.lookup(cause)
+    else:
+        cause_key = ''
+    symptoms_given = isinstance(symptoms, str) and bool(symptoms.strip())
+    return age, gender, symptoms_given, bool(split), symptom_key, cause_key
+
+
+class PredictionCache:
+    """Thread-safe LRU cache of predictions with a time to live.
+
+    Entries are keyed on the model version as well as the input, and the
+    whole cache is dropped the first time a newer model version is seen, so
+    a retrain never serves stale predictions.
+    """
+
+    def __init__(self, max_entries: int = PREDICTION_CACHE_SIZE, ttl: float = PREDICTION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_version(self, version: Hashable) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, version: Hashable, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, version: Hashable, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'model_version': str(self._version) if self._version is not None else None
+            }
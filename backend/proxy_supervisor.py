@@ -0,0 +1,158 @@
+import os
+import time
+import shlex
+import socket
+import asyncio
+import logging
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; workers there may race to start it
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Command that runs the OpenAI-compatible clewd proxy, from the backend directory
+PROXY_COMMAND = os.getenv('LLM_PROXY_COMMAND', 'node clewd.js')
+# Set to 0 when the proxy is managed outside the app, e.g. by start.sh or a container
+PROXY_AUTOSTART = os.getenv('LLM_PROXY_AUTOSTART', '1') == '1'
+PROXY_START_TIMEOUT = float(os.getenv('LLM_PROXY_START_TIMEOUT', '30'))
+PROXY_MAX_RESTART_DELAY = 30.0
+PROXY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def port_open(host: str, port: int, timeout: float = 0.5) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class ProxySupervisor:
+    """Starts the LLM proxy on demand and keeps it running.
+
+    Nothing happens at import; ensure_ready() probes the proxy's port and,
+    if nothing is listening, starts the proxy and polls the port with
+    backoff until it accepts connections. A file lock makes uvicorn workers
+    share one proxy: whichever worker starts it holds the lock until it is
+    listening, and the rest find the port open. The starting worker
+    restarts the proxy if it exits.
+    """
+
+    def __init__(self, url: str, command: str = PROXY_COMMAND, autostart: bool = PROXY_AUTOSTART,
+                 start_timeout: float = PROXY_START_TIMEOUT, cwd: str = PROXY_DIR):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.command = command
+        self.autostart = autostart
+        self.start_timeout = start_timeout
+        self.cwd = cwd
+        self.lock_path = os.path.join(tempfile.gettempdir(), f"mediai-llm-proxy-{self.port}.lock")
+        self._ready = False
+        self._process: Optional[subprocess.Popen] = None
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialise proxy starts across threads and worker processes"""
+        with self._lock, open(self.lock_path, 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def mark_down(self) -> None:
+        """Called when a request could not connect, so the next one probes again"""
+        self._ready = False
+
+    async def ensure_ready(self) -> bool:
+        """Whether the proxy accepts connections, starting it first if needed"""
+        if self._ready:
+            return True
+        return await asyncio.to_thread(self.ensure_ready_sync)
+
+    def ensure_ready_sync(self) -> bool:
+        if self._ready:
+            return True
+        if port_open(self.host, self.port):
+            self._ready = True
+            return True
+        if not self.autostart:
+            return False
+        with self._exclusive():
+            self._ready = port_open(self.host, self.port) or self._start()
+        return self._ready
+
+    def _start(self) -> bool:
+        """Launch the proxy and wait for its port; the caller holds the lock"""
+        if self._stopping:
+            return False
+        logger.info(f"Starting LLM proxy: {self.command}")
+        started = time.monotonic()
+        try:
+            process = subprocess.Popen(shlex.split(self.command), cwd=self.cwd)
+        except OSError as e:
+            logger.error(f"Could not start LLM proxy: {str(e)}")
+            return False
+        self._process = process
+        threading.Thread(target=self._watch, args=(process,), daemon=True).start()
+
+        delay = 0.05
+        while time.monotonic() - started < self.start_timeout:
+            if port_open(self.host, self.port):
+                logger.info(f"LLM proxy ready on port {self.port} after {time.monotonic() - started:.2f}s")
+                return True
+            if process.poll() is not None:
+                logger.error(f"LLM proxy exited with code {process.returncode} during startup")
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        logger.error(f"LLM proxy did not open port {self.port} within {self.start_timeout:.0f}s")
+        return False
+
+    def _watch(self, process: subprocess.Popen) -> None:
+        """Restart the proxy with backoff whenever the process this worker started exits"""
+        delay = 1.0
+        while True:
+            started = time.monotonic()
+            process.wait()
+            if self._stopping or self._process is not process:
+                return
+            self._ready = False
+            logger.warning(f"LLM proxy exited with code {process.returncode}")
+            if time.monotonic() - started > 60:
+                delay = 1.0
+            time.sleep(delay)
+            delay = min(delay * 2, PROXY_MAX_RESTART_DELAY)
+            with self._exclusive():
+                if self._stopping or port_open(self.host, self.port):
+                    # Another worker already brought a proxy back up
+                    self._process = None
+                    return
+                if not self._start():
+                    continue
+                # _start() runs a fresh watcher for the new process
+                return
+
+    def shutdown(self) -> None:
+        """Stop the proxy if this worker started it"""
+        self._stopping = True
+        process, self._process = self._process, None
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
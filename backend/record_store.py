@@ -0,0 +1,137 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECORDS_DB = os.getenv('RECORDS_DB', 'records.db')
+SEED_JSON = 'output.json'
+BATCH_SIZE = 1000
+
+
+class RecordStore:
+    """Append-only store for patient records backed by a local SQLite table.
+
+    Appends cost O(batch) and commit atomically. An upload appended in chunks
+    runs them inside transaction(), so a crash or error mid-upload leaves
+    either all or none of it and a retry can't add duplicates. SQLite's file
+    locking serialises writers
+    across threads, requests and uvicorn workers. Each record is kept as the
+    JSON object it was uploaded as, so sheets with extra columns still fit.
+    On first use an empty store is seeded from the legacy output.json.
+    """
+
+    def __init__(self, path: str = RECORDS_DB, seed_json: str = SEED_JSON):
+        self.path = path
+        self.seed_json = seed_json
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly below
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._setup(conn)
+            self._local.conn = conn
+        return conn
+
+    def _setup(self, conn: sqlite3.Connection) -> None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            seeded = conn.execute("SELECT value FROM meta WHERE key = 'seeded_from'").fetchone()
+            if seeded is None:
+                count = self._seed(conn)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('seeded_from', ?)", (self.seed_json or '',))
+                if count:
+                    logger.info(f"Seeded {self.path} with {count} records from {self.seed_json}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _seed(self, conn: sqlite3.Connection) -> int:
+        if not self.seed_json or not os.path.exists(self.seed_json):
+            return 0
+        try:
+            with open(self.seed_json, 'r') as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"Not seeding from {self.seed_json}: invalid JSON")
+            return 0
+        records = data if isinstance(data, list) else data.get('records', [])
+        conn.executemany("INSERT INTO records (data) VALUES (?)",
+                         ((json.dumps(record),) for record in records))
+        return len(records)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Commit every append() made in the block together, or none of them.
+
+        Other writers wait for the commit (up to the 30s busy timeout) while
+        readers keep seeing the records committed before it.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.in_transaction = True
+        try:
+            yield
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.in_transaction = False
+
+    def append(self, records: Iterable[Dict]) -> int:
+        """Append a batch of records in a single transaction, or the enclosing transaction()"""
+        rows = [(json.dumps(record),) for record in records]
+        if not rows:
+            return 0
+        if getattr(self._local, 'in_transaction', False):
+            self._connection().executemany("INSERT INTO records (data) VALUES (?)", rows)
+            return len(rows)
+        with self.transaction():
+            self._connection().executemany("INSERT INTO records (data) VALUES (?)", rows)
+        return len(rows)
+
+    def iter_rows(self, after_id: int = 0, batch_size: int = BATCH_SIZE) -> Iterator[Tuple[int, Dict]]:
+        """Stream (id, record) pairs in insertion order, starting after after_id"""
+        conn = self._connection()
+        while True:
+            batch = conn.execute(
+                "SELECT id, data FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, batch_size)
+            ).fetchall()
+            if not batch:
+                return
+            for record_id, data in batch:
+                yield record_id, json.loads(data)
+            after_id = batch[-1][0]
+
+    def iter_records(self, after_id: int = 0, batch_size: int = BATCH_SIZE) -> Iterator[Dict]:
+        """Stream records in insertion order without loading them all at once"""
+        for _, record in self.iter_rows(after_id, batch_size):
+            yield record
+
+    def get_many(self, record_ids: List[int]) -> Dict[int, Dict]:
+        """Records by id; ids that don't exist are left out"""
+        if not record_ids:
+            return {}
+        placeholders = ','.join('?' * len(record_ids))
+        rows = self._connection().execute(
+            f"SELECT id, data FROM records WHERE id IN ({placeholders})", list(record_ids)
+        ).fetchall()
+        return {record_id: json.loads(data) for record_id, data in rows}
+
+    def last_id(self) -> int:
+        """Id of the newest record; it only grows, so it doubles as a data version"""
+        row = self._connection().execute("SELECT MAX(id) FROM records").fetchone()
+        return row[0] or 0
@@ -0,0 +1,97 @@
+import os
+import re
+from typing import Dict, List
+
+CHUNK_CHARS = int(os.getenv('ANALYSIS_CHUNK_CHARS', '12000'))
+
+# "DISCHARGE SUMMARY", "Medications:", "3. Laboratory Results" and the like
+_HEADING = re.compile(r'^\s*(?:\d+[.)]\s*)?(?:[A-Z][A-Z0-9 /&(),-]{2,60}|[A-Z][\w /&(),-]{2,60}:)\s*$')
+_LIST_SECTIONS = {
+    'findings': 'text',
+    'terms': 'term',
+    'recommendations': 'title',
+}
+
+
+def split_sections(text: str) -> List[str]:
+    """Split report text before each line that looks like a section heading"""
+    sections = []
+    current: List[str] = []
+    for line in text.splitlines(keepends=True):
+        if current and _HEADING.match(line):
+            sections.append(''.join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append(''.join(current))
+    return sections
+
+
+def pack(pieces: List[str], max_chars: int, separators=('\n\n', '\n')) -> List[str]:
+    """Greedily join consecutive pieces into chunks of at most max_chars.
+
+    A piece longer than max_chars is itself split at the first separator
+    it contains, falling back to a hard cut.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for piece in pieces:
+        if len(piece) > max_chars:
+            if current:
+                chunks.append(''.join(current))
+                current, size = [], 0
+            chunks.extend(_split_long(piece, max_chars, separators))
+            continue
+        if size + len(piece) > max_chars and current:
+            chunks.append(''.join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece)
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def _split_long(piece: str, max_chars: int, separators) -> List[str]:
+    for level, separator in enumerate(separators):
+        parts = piece.split(separator)
+        if len(parts) > 1:
+            pieces = [part + separator for part in parts[:-1]] + [parts[-1]]
+            return pack(pieces, max_chars, separators[level + 1:])
+    return [piece[i:i + max_chars] for i in range(0, len(piece), max_chars)]
+
+
+def split_report(text: str, max_chars: int = CHUNK_CHARS) -> List[str]:
+    """Chunks of at most max_chars, cut at section boundaries where possible"""
+    if len(text) <= max_chars:
+        return [text]
+    return [chunk for chunk in pack(split_sections(text), max_chars) if chunk.strip()]
+
+
+def _dedup_key(value: str) -> str:
+    return ' '.join(re.sub(r'[^\w\s]', ' ', str(value).casefold()).split())
+
+
+def merge_analyses(analyses: List[Dict]) -> Dict:
+    """Combine per-chunk analyses into one in the same schema.
+
+    Summaries are kept in report order; findings, terms and recommendations
+    are concatenated with repeats (same text, term or title, ignoring case
+    and punctuation) dropped.
+    """
+    summaries = [analysis['summary'].strip() for analysis in analyses
+                 if isinstance(analysis.get('summary'), str) and analysis['summary'].strip()]
+    merged = {'summary': '\n\n'.join(summaries)}
+    for section, field in _LIST_SECTIONS.items():
+        seen = set()
+        items = []
+        for analysis in analyses:
+            for item in analysis.get(section) or []:
+                key = _dedup_key(item.get(field, '')) if isinstance(item, dict) else _dedup_key(item)
+                if key and key in seen:
+                    continue
+                seen.add(key)
+                items.append(item)
+        merged[section] = items
+    return merged
@@ -0,0 +1,210 @@
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+
+class Finding(BaseModel):
+    emoji: str = ''
+    text: str
+
+
+class Term(BaseModel):
+    term: str
+    explanation: str
+
+
+class Recommendation(BaseModel):
+    emoji: str = ''
+    title: str
+    description: str
+
+
+class ReportAnalysis(BaseModel):
+    """The analysis the LLM is prompted to return for a medical report"""
+    summary: str
+    findings: List[Finding] = []
+    terms: List[Term] = []
+    recommendations: List[Recommendation] = []
+
+
+class AnalysisError(ValueError):
+    """The LLM response held no analysis matching ReportAnalysis"""
+
+
+_SECTION_ADAPTERS = {
+    name: TypeAdapter(field.annotation) for name, field in ReportAnalysis.model_fields.items()
+}
+
+
+class JSONSectionScanner:
+    """Pick top-level fields out of a JSON object while it is still streaming in.
+
+    Feed the LLM output as it arrives; feed() returns each (key, value) pair of
+    the first top-level object as soon as that value is complete. Prose before
+    the object is skipped. Every character is examined once.
+    """
+
+    def __init__(self):
+        # Chunks are only joined when a value is decoded, not on every feed()
+        self._chunks: List[str] = []
+        self._length = 0
+        self.done = False
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    @property
+    def buffer(self) -> str:
+        """Everything fed so far"""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        offset = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        sections = []
+        for i, char in enumerate(chunk, offset):
+            if self.done:
+                break
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = self._decode(self._key_start, i + 1)
+                        self._key_start = None
+                continue
+
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                    self.start = i
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None:
+                    self._key_start = i
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(i, sections)
+                    self.done = True
+                    self.end = i + 1
+            elif self._depth == 1:
+                if char == ':' and self._key is not None:
+                    self._value_start = i + 1
+                elif char == ',':
+                    self._finish_value(i, sections)
+        return sections
+
+    def object_text(self) -> Optional[str]:
+        """The complete top-level object, once it has been closed"""
+        if not self.done:
+            return None
+        return self.buffer[self.start:self.end]
+
+    def _decode(self, start: int, end: int) -> Any:
+        try:
+            return json.loads(self.buffer[start:end])
+        except json.JSONDecodeError:
+            return None
+
+    def _finish_value(self, end: int, sections: List[Tuple[str, Any]]) -> None:
+        if self._key is not None and self._value_start is not None:
+            value = self._decode(self._value_start, end)
+            if value is not None:
+                sections.append((self._key, value))
+        self._key = None
+        self._value_start = None
+
+
+# Characters that open, close or quote JSON values
+_STRUCTURE = re.compile(r'[{}\[\]"\\]')
+
+
+def _first_object(text: str, candidates: List[Tuple[int, int]]) -> Optional[Dict[str, Any]]:
+    for start, end in sorted(candidates):
+        try:
+            value = json.loads(text[start:end])
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """The first balanced {...} in text that parses as a JSON object.
+
+    One pass pairs up the brackets outside strings and keeps the start and
+    end of every balanced {...}; these are parsed in order of where they
+    start, each group as soon as its outermost bracket closes.
+    """
+    candidates: List[Tuple[int, int]] = []
+    openers: List[Tuple[str, int]] = []
+    in_string = False
+    escaped = -1
+    for match in _STRUCTURE.finditer(text):
+        i, char = match.start(), match.group()
+        if in_string:
+            if i == escaped:
+                continue
+            if char == '\\':
+                escaped = i + 1
+            elif char == '"':
+                in_string = False
+        elif char == '{' or (char == '[' and openers):
+            # Brackets in the prose before an object are not JSON
+            openers.append((char, i))
+        elif char in '}]':
+            if not openers:
+                continue
+            opener, start = openers.pop()
+            if opener == '{':
+                candidates.append((start, i + 1))
+            if not openers:
+                value = _first_object(text, candidates)
+                if value is not None:
+                    return value
+                candidates = []
+        elif char == '"' and openers:
+            # Quotes only start strings inside a value, not in surrounding prose
+            in_string = True
+    return _first_object(text, candidates)
+
+
+def parse_analysis(raw_analysis: str) -> ReportAnalysis:
+    """Extract and validate the analysis in an LLM response, or raise AnalysisError"""
+    value = extract_json_object(raw_analysis)
+    if value is None:
+        raise AnalysisError(f"No JSON object in LLM response: {raw_analysis[:200]!r}")
+    try:
+        return ReportAnalysis.model_validate(value)
+    except ValidationError as e:
+        raise AnalysisError(f"LLM response does not match the analysis schema: {e}") from e
+
+
+def validate_section(name: str, value: Any) -> Any:
+    """Validate one streamed top-level field; unknown fields pass through unchanged"""
+    adapter = _SECTION_ADAPTERS.get(name)
+    if adapter is None:
+        return value
+    try:
+        return adapter.dump_python(adapter.validate_python(value))
+    except ValidationError as e:
+        raise AnalysisError(f"Invalid {name} in LLM response: {e}") from e
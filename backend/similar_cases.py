@@ -0,0 +1,121 @@
+import threading
+import logging
+import numpy as np
+from array import array
+from typing import Any, Dict, List, Optional
+from dataset_cache import CompiledDataset, DatasetCache, safe_split
+from decoding import top_k
+from normalization import InputNormalizer, derive_synonyms
+
+logger = logging.getLogger(__name__)
+
+# Score = symptom Jaccard similarity plus these bonuses for matching the rest.
+# Age is left out: uploaded records carry a date of birth, not an age.
+CAUSE_WEIGHT = 0.25
+GENDER_WEIGHT = 0.1
+MAX_K = 50
+
+
+class SimilarCaseIndex:
+    """Inverted index from symptoms and causes to past patient records.
+
+    Built over the compiled dataset's encoded columns, so a query only scores
+    the records sharing a symptom or the cause with it instead of scanning
+    every record. refresh() indexes just the records compiled since the
+    previous refresh.
+    """
+
+    def __init__(self, dataset_cache: DatasetCache):
+        self.dataset_cache = dataset_cache
+        self._lock = threading.Lock()
+        self._dataset: Optional[CompiledDataset] = None
+        self._symptom_nnz = 0
+        self._symptom_postings: Dict[int, array] = {}
+        # Distinct symptoms per row; a record may list a symptom more than once
+        self._symptom_sizes = np.empty(0, dtype=np.int32)
+        self._cause_postings: Dict[int, array] = {}
+        self._normalizer: Optional[InputNormalizer] = None
+        self._vocab_ids: Dict[str, Dict[str, int]] = {}
+
+    def refresh(self) -> int:
+        """Compile and index records added to the store; returns how many were indexed"""
+        dataset = self.dataset_cache.refresh()
+        with self._lock:
+            previous = self._dataset
+            if previous is None or dataset.n_rows < previous.n_rows \
+                    or dataset.last_record_id < previous.last_record_id:
+                # First build, or the dataset was recompiled from scratch
+                self._symptom_postings = {}
+                self._cause_postings = {}
+                self._symptom_nnz = 0
+                self._symptom_sizes = np.empty(0, dtype=np.int32)
+                start = 0
+            else:
+                start = previous.n_rows
+            if start == dataset.n_rows and previous is not None:
+                self._dataset = dataset
+                return 0
+
+            counts = np.asarray(dataset.symptom_counts[start:], dtype=np.int64)
+            offsets = self._symptom_nnz + np.concatenate([[0], np.cumsum(counts)])
+            sizes = np.empty(len(counts), dtype=np.int32)
+            for row, (begin, end) in enumerate(zip(offsets[:-1], offsets[1:]), start):
+                distinct = set(dataset.symptom_indices[begin:end].tolist())
+                sizes[row - start] = len(distinct)
+                for symptom_id in distinct:
+                    self._symptom_postings.setdefault(symptom_id, array('i')).append(row)
+                self._cause_postings.setdefault(int(dataset.cause_ids[row]), array('i')).append(row)
+
+            self._symptom_nnz = int(offsets[-1])
+            # Replaced rather than grown in place, so queries can keep the old array
+            self._symptom_sizes = np.concatenate([self._symptom_sizes, sizes])
+            self._dataset = dataset
+            self._normalizer = InputNormalizer(
+                dataset.vocab['symptoms'], dataset.vocab['causes'],
+                record_synonyms={name: derive_synonyms(dataset.label_counts(name))
+                                 for name in ('symptoms', 'causes')}
+            )
+            self._vocab_ids = {name: {label: i for i, label in enumerate(dataset.vocab[name])}
+                               for name in ('symptoms', 'causes')}
+            added = dataset.n_rows - start
+        logger.info(f"Indexed {added} records for similar-case search ({dataset.n_rows} total)")
+        return added
+
+    def query(self, gender: str, symptoms: str, cause: str, k: int = 5) -> List[Dict[str, Any]]:
+        """The k most similar past records as [{'record_id', 'score'}], best first"""
+        with self._lock:
+            dataset = self._dataset
+            if dataset is None or not dataset.n_rows:
+                return []
+            symptom_sizes = self._symptom_sizes
+            symptom_ids = {self._vocab_ids['symptoms'][name]
+                           for name in self._normalizer.symptoms(safe_split(symptoms))}
+            cause_id = self._vocab_ids['causes'].get(self._normalizer.cause(cause or ''), -1)
+            # Copies, so refresh() can keep appending to the posting lists
+            postings = [np.array(self._symptom_postings[i], dtype=np.int32)
+                        for i in symptom_ids if i in self._symptom_postings]
+            cause_rows = np.array(self._cause_postings.get(cause_id, ()), dtype=np.int32)
+
+        if postings:
+            rows, shared = np.unique(np.concatenate(postings), return_counts=True)
+        else:
+            rows, shared = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        extra = np.setdiff1d(cause_rows, rows, assume_unique=True)
+        rows = np.concatenate([rows, extra])
+        shared = np.concatenate([shared, np.zeros(len(extra), dtype=shared.dtype)])
+        if not len(rows):
+            return []
+
+        sizes = symptom_sizes[rows].astype(np.float64)
+        union = len(symptom_ids) + sizes - shared
+        scores = np.divide(shared, union, out=np.zeros(len(rows)), where=union > 0)
+        scores += CAUSE_WEIGHT * (np.asarray(dataset.cause_ids[rows]) == cause_id)
+        is_male = 1 if str(gender).upper().startswith('M') else 0
+        scores += GENDER_WEIGHT * (np.asarray(dataset.genders[rows]) == is_male)
+
+        best, best_scores = top_k(scores.reshape(1, -1), max(1, min(k, MAX_K)))
+        record_ids = np.asarray(dataset.record_ids)[rows[best[0]]]
+        return [
+            {'record_id': int(record_id), 'score': round(float(score), 4)}
+            for record_id, score in zip(record_ids, best_scores[0])
+        ]
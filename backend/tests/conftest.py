@@ -0,0 +1,53 @@
+import os
+import sys
+import random
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from record_store import RecordStore  # noqa: E402
+
+# Each synthetic disease has typical symptoms, a cause and medicines
+DISEASES = {
+    'Common Cold': (['Fever', 'Cough', 'Sore Throat', 'Sneezing'], 'Viral Infection', ['Rest', 'Paracetamol']),
+    'Migraine': (['Headache', 'Nausea', 'Blurred Vision'], 'Stress', ['Sumatriptan']),
+    'Gastritis': (['Stomach Pain', 'Bloating', 'Nausea'], 'Spicy Food', ['Antacid', 'Omeprazole']),
+    'Arthritis': (['Joint Pain', 'Swelling', 'Fatigue'], 'Autoimmune Response', ['Ibuprofen']),
+}
+
+
+def synthetic_records(n, seed=0, diseases=DISEASES):
+    """n patient records in the upload format, with symptoms drawn from each disease's set"""
+    rng = random.Random(seed)
+    names = sorted(diseases)
+    records = []
+    for i in range(n):
+        disease = names[i % len(names)]
+        symptoms, cause, medicines = diseases[disease]
+        records.append({
+            'Name': f'Patient {i}',
+            'DateOfBirth': '01-01-1980',
+            'Gender': rng.choice(['Male', 'Female']),
+            'Symptoms': ', '.join(rng.sample(symptoms, rng.randint(2, len(symptoms)))),
+            'Causes': cause,
+            'Disease': disease,
+            'Medicine': ', '.join(medicines),
+        })
+    return records
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RecordStore(str(tmp_path / 'records.db'), seed_json='')
+
+
+@pytest.fixture
+def core(tmp_path, store):
+    """Models fitted on synthetic records; the fast incremental core stands in for the full one"""
+    from dataset_cache import DatasetCache
+    from incremental import IncrementalModelCore
+    store.append(synthetic_records(80))
+    core = IncrementalModelCore(artifact_dir=None)
+    core.train(DatasetCache(store, str(tmp_path / 'dataset')).refresh())
+    return core
@@ -0,0 +1,63 @@
+import numpy as np
+import dataset_cache
+from conftest import synthetic_records
+from dataset_cache import COLUMNS, DatasetCache
+from record_store import RecordStore
+
+
+def assert_same_dataset(actual, expected):
+    assert actual.n_rows == expected.n_rows
+    assert actual.data_digest == expected.data_digest
+    assert actual.vocab == expected.vocab
+    for name in COLUMNS:
+        assert np.array_equal(getattr(actual, name), getattr(expected, name)), name
+
+
+def compiled_from_scratch(tmp_path, records):
+    tmp_path.mkdir(exist_ok=True)
+    store = RecordStore(str(tmp_path / 'scratch.db'), seed_json='')
+    store.append(records)
+    return DatasetCache(store, str(tmp_path / 'scratch')).refresh()
+
+
+def test_refresh_only_compiles_new_records(tmp_path, store, monkeypatch):
+    first, second = synthetic_records(30), synthetic_records(20, seed=1)
+    cache = DatasetCache(store, str(tmp_path / 'dataset'))
+    store.append(first)
+    assert len(cache.refresh()) == 30
+
+    cleaned = []
+    clean_record = dataset_cache.clean_record
+    monkeypatch.setattr(dataset_cache, 'clean_record', lambda record: cleaned.append(record) or clean_record(record))
+    store.append(second)
+    dataset = cache.refresh()
+    assert len(cleaned) == 20
+    assert cache.refresh().n_rows == 50
+    assert len(cleaned) == 20
+    assert_same_dataset(dataset, compiled_from_scratch(tmp_path, first + second))
+
+
+def test_refresh_drops_the_tail_of_an_interrupted_refresh(tmp_path, store):
+    first, second = synthetic_records(30), synthetic_records(20, seed=1)
+    cache = DatasetCache(store, str(tmp_path / 'dataset'))
+    store.append(first)
+    cache.refresh()
+    # Column bytes written by a refresh that died before replacing meta.json
+    for name in ('ages', 'symptom_indices'):
+        with open(cache._column_path(name), 'ab') as f:
+            f.write(b'\x07' * 64)
+
+    assert_same_dataset(cache.load(), compiled_from_scratch(tmp_path / 'before', first))
+    store.append(second)
+    assert_same_dataset(cache.refresh(), compiled_from_scratch(tmp_path / 'after', first + second))
+
+
+def test_replaced_store_is_recompiled(tmp_path, store):
+    cache = DatasetCache(store, str(tmp_path / 'dataset'))
+    store.append(synthetic_records(30))
+    cache.refresh()
+
+    replacement = RecordStore(str(tmp_path / 'replacement.db'), seed_json='')
+    replacement.append(synthetic_records(10, seed=2))
+    cache.store = replacement
+    assert_same_dataset(cache.refresh(), compiled_from_scratch(tmp_path, synthetic_records(10, seed=2)))
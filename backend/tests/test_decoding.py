@@ -0,0 +1,37 @@
+import numpy as np
+from decoding import decode_top_k, multioutput_confidence, top_k
+
+
+def test_top_k_matches_a_full_stable_sort():
+    # Few distinct values, so most rows have ties
+    scores = np.random.default_rng(0).integers(0, 4, size=(50, 9)) / 4
+    expected = np.argsort(-scores, axis=1, kind='stable')
+    for k in (1, 3, 9, 20, None):
+        indices, values = top_k(scores, k)
+        width = 9 if k is None else min(k, 9)
+        assert (indices == expected[:, :width]).all()
+        assert (values == np.take_along_axis(scores, expected[:, :width], axis=1)).all()
+
+
+def test_decode_top_k_applies_threshold_and_mask():
+    scores = np.array([[0.1, 0.7, 0.25, 0.05],
+                       [0.4, 0.3, 0.2, 0.1]])
+    names = np.array(['Flu', 'Cold', 'Migraine', 'Asthma'])
+    assert decode_top_k(scores, names, k=2, threshold=0.2) == [
+        [('Cold', 70.0), ('Migraine', 25.0)],
+        [('Flu', 40.0), ('Cold', 30.0)],
+    ]
+    mask = np.array([[True, False, True, True],
+                     [False, False, False, False]])
+    assert decode_top_k(scores, names, mask=mask) == [
+        [('Migraine', 25.0), ('Flu', 10.0), ('Asthma', 5.0)],
+        [],
+    ]
+
+
+def test_multioutput_confidence_handles_single_class_outputs():
+    probas = [np.array([[0.2, 0.8], [0.9, 0.1]]), np.array([[1.0], [1.0]])]
+    classes = [np.array([0, 1]), np.array([1])]
+    confidence, positive = multioutput_confidence(probas, classes)
+    assert np.allclose(confidence, [[0.8, 1.0], [0.9, 1.0]])
+    assert positive.tolist() == [[True, True], [False, True]]
@@ -0,0 +1,46 @@
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+from evaluation import cross_validate, evaluation_folds
+
+DISEASES = ['Flu', 'Migraine', 'Gastritis']
+MEDICINES = ['Rest', 'Sumatriptan', 'Antacid']
+
+
+def labelled_data(n, seed=0, noise=0.1):
+    """Features that point at the disease; each disease has its own medicine"""
+    rng = np.random.default_rng(seed)
+    y_diseases = rng.integers(0, len(DISEASES), n)
+    X = np.eye(len(DISEASES))[y_diseases] + rng.normal(0, noise, (n, len(DISEASES)))
+    y_medicines = np.eye(len(MEDICINES), dtype=np.int64)[y_diseases]
+    return X, y_diseases, y_medicines
+
+
+def test_learnable_data_scores_high():
+    X, y_diseases, y_medicines = labelled_data(120)
+    report = cross_validate(KNeighborsClassifier(3), KNeighborsClassifier(3), X, y_diseases, y_medicines,
+                            DISEASES, MEDICINES, n_splits=4, n_jobs=2)
+    assert (report['folds'], report['samples']) == (4, 120)
+    assert report['disease']['accuracy'] == 1.0
+    assert report['disease']['top_k_accuracy']['1'] == 1.0
+    assert sum(c['support'] for c in report['disease']['per_class'].values()) == 120
+    assert report['medicine']['subset_accuracy'] == 1.0
+    assert report['medicine']['top_k']['1']['hit_rate'] == 1.0
+
+
+def test_scores_come_from_held_out_rows():
+    # Random labels: a 1-nearest-neighbour model is perfect on its own training rows only
+    X, _, _ = labelled_data(150, noise=1.0)
+    y_diseases = np.random.default_rng(1).integers(0, len(DISEASES), 150)
+    y_medicines = np.eye(len(MEDICINES), dtype=np.int64)[y_diseases]
+    assert (KNeighborsClassifier(1).fit(X, y_diseases).predict(X) == y_diseases).all()
+
+    report = cross_validate(KNeighborsClassifier(1), KNeighborsClassifier(1), X, y_diseases, y_medicines,
+                            DISEASES, MEDICINES, n_splits=5, n_jobs=1)
+    assert report['disease']['accuracy'] < 0.6
+    assert report['medicine']['subset_accuracy'] < 0.6
+
+
+def test_evaluation_folds_needs_two_samples():
+    assert evaluation_folds(100, 5) == 5
+    assert evaluation_folds(3, 5) == 3
+    assert evaluation_folds(1, 5) == 0
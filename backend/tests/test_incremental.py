@@ -0,0 +1,75 @@
+import pytest
+from conftest import DISEASES, synthetic_records
+from dataset_cache import DatasetCache
+from incremental import IncrementalModelCore
+from record_store import RecordStore
+
+
+@pytest.fixture
+def fits(monkeypatch):
+    """Names of the training paths taken, in order"""
+    calls = []
+    for name in ('_full_fit', '_update'):
+        method = getattr(IncrementalModelCore, name)
+
+        def spy(self, dataset, method=method, name=name):
+            calls.append(name)
+            return method(self, dataset)
+
+        monkeypatch.setattr(IncrementalModelCore, name, spy)
+    return calls
+
+
+@pytest.fixture
+def train(tmp_path, store):
+    cache = DatasetCache(store, str(tmp_path / 'dataset'))
+
+    def train(records):
+        store.append(records)
+        core = IncrementalModelCore(str(tmp_path / 'artifacts'))
+        core.train(cache.refresh())
+        return core
+
+    return train
+
+
+def test_new_rows_update_the_previous_models(train, fits):
+    first = train(synthetic_records(100))
+    second = train(synthetic_records(40, seed=1))
+    assert fits == ['_full_fit', '_update']
+    assert second.model_version != first.model_version
+    assert (second.rows_at_refit, second.trained_rows, second.updates_since_refit) == (100, 140, 1)
+    scores = second.predict_scores([{'age': 30, 'gender': 'M', 'symptoms': 'Headache, Nausea', 'cause': 'Stress'}])
+    assert second.disease_encoder.classes_[scores.disease_probs.argmax()] == 'Migraine'
+
+
+def test_unchanged_data_loads_the_saved_models(train, fits):
+    first = train(synthetic_records(100))
+    again = train([])
+    assert fits == ['_full_fit']
+    assert again.model_version == first.model_version
+
+
+def test_refits_once_the_data_grows_past_the_limit(train, fits):
+    train(synthetic_records(100))
+    core = train(synthetic_records(60, seed=1))
+    assert fits == ['_full_fit', '_full_fit']
+    assert (core.rows_at_refit, core.updates_since_refit) == (160, 0)
+
+
+def test_new_labels_within_reserved_room_are_updated(train, fits):
+    train(synthetic_records(100))
+    flu = {'Influenza': (['High Fever', 'Chills', 'Body Aches'], 'Influenza Virus', ['Oseltamivir'])}
+    core = train(synthetic_records(30, seed=1, diseases={**DISEASES, **flu}))
+    assert fits == ['_full_fit', '_update']
+    assert 'Influenza' in core.disease_encoder.classes_
+
+
+def test_rebuilt_dataset_is_refitted(tmp_path, train, fits):
+    train(synthetic_records(100))
+    replacement = RecordStore(str(tmp_path / 'replacement.db'), seed_json='')
+    replacement.append(synthetic_records(50, seed=2))
+    core = IncrementalModelCore(str(tmp_path / 'artifacts'))
+    core.train(DatasetCache(replacement, str(tmp_path / 'replacement')).refresh())
+    assert fits == ['_full_fit', '_full_fit']
+    assert core.trained_rows == 50
@@ -0,0 +1,134 @@
+import json
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+import main
+from conftest import synthetic_records
+from incremental import IncrementalModelCore
+from model_registry import ModelRegistry, ModelSnapshot
+from prediction_cache import PredictionCache
+from similar_cases import SimilarCaseIndex
+
+PATIENT = {'Name': 'John Doe', 'DateOfBirth': '15-05-1980', 'Gender': 'Male', 'Symptoms': 'Fever, Cough',
+           'Causes': 'Viral Infection', 'Disease': 'Common Cold', 'Medicine': 'Ibuprofen, Rest'}
+
+
+@pytest.fixture
+def registry(tmp_path, store, monkeypatch):
+    registry = ModelRegistry(store, str(tmp_path / 'artifacts'), str(tmp_path / 'dataset'), evaluate=False)
+    monkeypatch.setattr(main, 'registry', registry)
+    return registry
+
+
+@pytest.fixture
+def trained(registry, monkeypatch):
+    """registry serving models fitted on synthetic records; the fast incremental core stands in for the full one"""
+    registry.store.append(synthetic_records(80))
+    dataset = registry.dataset_cache.refresh()
+    core = IncrementalModelCore(artifact_dir=None)
+    core.train(dataset)
+    registry._publish(ModelSnapshot(core, registry.source_version(), dataset))
+    monkeypatch.setattr(main, 'prediction_cache', PredictionCache())
+    return registry
+
+
+@pytest.fixture
+def client():
+    # Not used as a context manager, so the lifespan's model build doesn't run
+    return TestClient(main.app)
+
+
+def test_similar_cases_leave_out_identifying_fields(registry, client, monkeypatch):
+    registry.store.append([PATIENT])
+    case_index = SimilarCaseIndex(registry.dataset_cache)
+    case_index.refresh()
+    monkeypatch.setattr(main, 'case_index', case_index)
+
+    response = client.post('/similar-cases', json={'symptoms': 'Fever, Cough', 'gender': 'M'})
+    assert response.status_code == 200
+    (case,) = response.json()['cases']
+    assert case['record'] == {field: PATIENT[field] for field in main.CASE_FIELDS}
+    assert 'Name' not in case['record'] and 'DateOfBirth' not in case['record']
+
+
+ANALYSIS = {'summary': 'Mild anemia', 'findings': [{'emoji': '', 'text': 'Low hemoglobin'}],
+            'terms': [], 'recommendations': []}
+
+
+class FakeLLM:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.sent = 0
+
+    async def stream(self, query, system_prompt, max_tokens=1024):
+        for token in self.tokens:
+            self.sent += 1
+            yield token
+
+
+def stream_events(monkeypatch, tmp_path, tokens):
+    llm = FakeLLM(tokens)
+    monkeypatch.setattr(main, 'llm_client', llm)
+    monkeypatch.setattr(main, 'analysis_cache', main.AnalysisCache(str(tmp_path / 'analysis')))
+
+    async def collect():
+        return [event async for event in main.stream_medical_analysis('report.pdf', {'text_content': 'Hb 9.1 g/dL'}, 0.0)]
+
+    events = []
+    for raw in asyncio.run(collect()):
+        name, data = raw.strip().split('\n')
+        events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return events, llm
+
+
+def test_stream_stops_once_the_analysis_is_complete(monkeypatch, tmp_path):
+    text = json.dumps(ANALYSIS)
+    events, llm = stream_events(monkeypatch, tmp_path, [text[:20], text[20:], ' Hope this helps', '!'])
+    assert [value for name, value in events if name == 'section'] == \
+        [{'name': name, 'value': value} for name, value in ANALYSIS.items()]
+    assert events[-1] == ('done', {'analysis': ANALYSIS})
+    assert llm.sent == 2
+
+
+def test_stream_skips_an_object_in_leading_prose(monkeypatch, tmp_path):
+    text = json.dumps(ANALYSIS)
+    tokens = ['Here is {"note": "the analysis"} as ', 'requested: ' + text[:30], text[30:]]
+    events, llm = stream_events(monkeypatch, tmp_path, tokens)
+    names = [name for name, _ in events]
+    # The prose object's section is withdrawn before the real ones arrive
+    assert names.index('reset') < names.index('section', names.index('reset'))
+    after_reset = [value['name'] for name, value in events[names.index('reset'):] if name == 'section']
+    assert after_reset == list(ANALYSIS)
+    assert events[-1] == ('done', {'analysis': ANALYSIS})
+
+
+def test_batch_prediction_reports_bad_rows_individually(trained, client):
+    patients = [
+        {'age': 30, 'gender': 'M', 'symptoms': 'Fever, Cough, Sneezing', 'cause': 'Viral Infection'},
+        'abc',
+        None,
+        {'age': 'old', 'symptoms': 'Fever'},
+        {'age': 30, 'symptoms': ['Fever']},
+        {'age': 45, 'gender': 'F', 'symptoms': 'Joint Pain, Swelling', 'cause': 'Autoimmune Response'},
+        {'age': 45, 'gender': 'F', 'symptoms': '', 'cause': ''},
+    ]
+    response = client.post('/predict-medical/batch', json={'patients': patients})
+    assert response.status_code == 200
+    predictions = response.json()['predictions']
+    assert len(predictions) == len(patients)
+    assert predictions[0]['basic_prediction']['diseases'][0]['name'] == 'Common Cold'
+    assert predictions[5]['basic_prediction']['diseases'][0]['name'] == 'Arthritis'
+    assert [prediction.get('error') for prediction in predictions[1:5]] == [
+        'Patient must be an object', 'Patient must be an object', 'Invalid age', 'Invalid symptoms']
+    assert predictions[6]['basic_prediction'] == {'diseases': [], 'medicines': []}
+
+
+def test_batch_prediction_needs_a_list(client):
+    assert client.post('/predict-medical/batch', json={'patients': 'abc'}).status_code == 400
+
+
+def test_metrics_label_requests_by_route_template(client):
+    client.post('/predict-medical/batch', json={'patients': 'abc'})
+    response = client.get('/metrics')
+    assert response.headers['content-type'] == main.CONTENT_TYPE
+    assert 'route="/predict-medical/batch",status="400"' in response.text
@@ -0,0 +1,23 @@
+from medical_predictor import MedicalPredictor
+
+
+def test_predict_batch_reports_rejected_rows(core):
+    predictor = MedicalPredictor(core=core)
+    ok, empty = predictor.predict_batch([
+        {'age': 30, 'gender': 'M', 'symptoms': 'Headache, Nausea', 'cause': 'Stress'},
+        {'age': 30, 'gender': 'M', 'symptoms': ' , ', 'cause': 'Stress'},
+    ])
+    assert 'error' not in ok
+    assert ok['diseases'][0][0] == 'Migraine'
+    assert empty == {'diseases': [], 'medicines': [], 'error': "No valid symptoms provided"}
+
+
+def test_predict_batch_reports_model_failures(core, monkeypatch, caplog):
+    def fail(patients):
+        raise RuntimeError("model exploded")
+
+    monkeypatch.setattr(core, 'predict_scores', fail)
+    predictor = MedicalPredictor(core=core)
+    (result,) = predictor.predict_batch([{'age': 30, 'gender': 'M', 'symptoms': 'Headache', 'cause': 'Stress'}])
+    assert result == {'diseases': [], 'medicines': [], 'error': "Prediction failed: model exploded"}
+    assert "Prediction failed" in caplog.text
@@ -0,0 +1,50 @@
+import pytest
+from metrics import CallbackMetric, Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_renders_the_text_exposition_format():
+    registry = MetricsRegistry()
+    requests = registry.register(Counter('requests_total', 'Requests', ('route',)))
+    version = registry.register(Gauge('model_info', 'Model version', ('version',)))
+    latency = registry.register(Histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0)))
+    registry.register(CallbackMetric('cache_entries', 'Entries', 'gauge', lambda: 3))
+    registry.register(CallbackMetric('unset', 'Skipped while None', 'gauge', lambda: None))
+
+    requests.inc(route='/predict')
+    requests.inc(2, route='/predict')
+    requests.inc(route='say "hi"\n')
+    version.replace(1, version='a')
+    version.replace(1, version='b')
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    assert registry.render() == '\n'.join([
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/predict"} 3',
+        'requests_total{route="say \\"hi\\"\\n"} 1',
+        '# HELP model_info Model version',
+        '# TYPE model_info gauge',
+        'model_info{version="b"} 1',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 3.65',
+        'latency_seconds_count 4',
+        '# HELP cache_entries Entries',
+        '# TYPE cache_entries gauge',
+        'cache_entries 3',
+        '# HELP unset Skipped while None',
+        '# TYPE unset gauge',
+    ]) + '\n'
+
+
+def test_rejects_mismatched_labels_and_duplicate_names():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter('requests_total', 'Requests', ('route',)))
+    with pytest.raises(ValueError):
+        counter.inc(status='200')
+    with pytest.raises(ValueError):
+        registry.register(Counter('requests_total', 'Again'))
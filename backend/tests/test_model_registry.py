@@ -0,0 +1,59 @@
+import threading
+import pytest
+import model_registry
+from conftest import synthetic_records
+from model_registry import ModelRegistry
+
+
+@pytest.fixture
+def registry(tmp_path, store, monkeypatch):
+    builds = []
+    make_model_core = model_registry.make_model_core
+
+    def make_core(artifact_dir):
+        builds.append(artifact_dir)
+        return make_model_core(None, mode='incremental')
+
+    # Fast incremental models without artifacts; builds counts the trainings
+    monkeypatch.setattr(model_registry, 'make_model_core', make_core)
+    store.append(synthetic_records(40))
+    registry = ModelRegistry(store, str(tmp_path / 'artifacts'), str(tmp_path / 'dataset'), evaluate=False)
+    registry.builds = builds
+    return registry
+
+
+def test_stale_snapshot_keeps_serving_until_the_swap(registry):
+    first = registry.current()
+    assert first.source_version == 40
+
+    stale = []
+    registry.on_stale = lambda: stale.append(True)
+    registry.store.append(synthetic_records(8, seed=1))
+    # New records only schedule a rebuild; the request still gets the old models
+    assert registry.current() is first
+    assert stale == [True]
+
+    assert registry.refresh_if_changed()
+    second = registry.current()
+    assert second is not first
+    assert second.source_version == 48
+    # The replaced snapshot is left intact for requests still holding it
+    assert first.source_version == 40
+    assert first.core is not second.core
+
+
+def test_concurrent_refreshes_build_once(registry):
+    start = threading.Barrier(4)
+
+    def refresh():
+        start.wait()
+        registry.refresh_if_changed()
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(registry.builds) == 1
+    assert not registry.refresh_if_changed()
+    assert len(registry.builds) == 1
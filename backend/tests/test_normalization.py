@@ -0,0 +1,82 @@
+from normalization import InputNormalizer, VocabularyIndex, derive_synonyms
+
+LABELS = ['Fever', 'Shortness of breath', 'Shortness of breat', 'Stomach Pain', 'Viral Infection ']
+
+
+def test_exact_match():
+    index = VocabularyIndex(LABELS, {})
+    assert index.lookup('Fever') == 'Fever'
+    assert index.lookup('Shortness of breat') == 'Shortness of breat'
+
+
+def test_canonical_form_ignores_case_spacing_and_punctuation():
+    index = VocabularyIndex(LABELS, {})
+    assert index.lookup('  stomach   PAIN. ') == 'Stomach Pain'
+    assert index.lookup('viral infection') == 'Viral Infection '
+
+
+def test_synonym_table():
+    index = VocabularyIndex(LABELS, {'pyrexia': 'Fever', 'tummy ache': 'stomach pain', 'gout': 'Gout'})
+    assert index.lookup('Pyrexia') == 'Fever'
+    # Targets resolve to the trained label through their canonical form
+    assert index.lookup('tummy ache') == 'Stomach Pain'
+    # Aliases onto classes the models don't know are ignored
+    assert index.lookup('gout') is None
+    assert index.sources['pyrexia'] == 'table'
+
+
+def test_fuzzy_match():
+    index = VocabularyIndex(LABELS, {})
+    assert index.lookup('Stomac Pian') == 'Stomach Pain'
+    assert index.lookup('Completely different') is None
+
+
+def test_lookups_are_memoized():
+    index = VocabularyIndex(LABELS, {})
+    index.lookup('Stomac Pian')
+    index.lookup('Stomac Pian')
+    info = index.lookup.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_derive_synonyms_maps_variants_onto_the_most_common_form():
+    aliases = derive_synonyms({
+        'Shortness of breat': 3,
+        'Shortness of breath': 120,
+        'Shortnessof breath': 1,
+        'Viral Infection     ': 4,
+        'Viral Infection': 80,
+        'Rheumatoid Arthriti': 2,
+        'Rheumatoid Arthritis': 40,
+        'Stomach Pain': 30,
+        'Abdominal Pain': 25,
+    })
+    assert aliases == {
+        'Shortness of breat': 'Shortness of breath',
+        'Shortnessof breath': 'Shortness of breath',
+        'Viral Infection     ': 'Viral Infection',
+        'Rheumatoid Arthriti': 'Rheumatoid Arthritis',
+    }
+
+
+def test_record_synonyms_redirect_every_step():
+    record_synonyms = {'Shortness of breat': 'Shortness of breath', 'Viral Infection ': 'Viral Infection'}
+    index = VocabularyIndex(LABELS + ['Viral Infection'], {'sob': 'shortness of breat'},
+                            record_synonyms=record_synonyms)
+    assert index.lookup('Shortness of breat') == 'Shortness of breath'
+    assert index.lookup('viral infection') == 'Viral Infection'
+    assert index.lookup('SOB') == 'Shortness of breath'
+    assert index.lookup('Shortnes of breat') == 'Shortness of breath'
+    assert index.sources['shortness of breat'] == 'records'
+    # A record alias whose target the models don't know is ignored
+    index = VocabularyIndex(LABELS, {}, record_synonyms={'Fever': 'High Fever'})
+    assert index.lookup('Fever') == 'Fever'
+
+
+def test_input_normalizer_merges_builtin_and_record_synonyms():
+    normalizer = InputNormalizer(LABELS, ['Viral Infection', 'Viral Infection  '],
+                                 record_synonyms={'symptoms': {'Shortness of breat': 'Shortness of breath'},
+                                                  'causes': {'Viral Infection  ': 'Viral Infection'}})
+    assert normalizer.symptoms(['temperature', 'Shortness of breat', 'sob']) == ['Fever', 'Shortness of breath']
+    assert normalizer.cause('flu') == 'Viral Infection'
+    assert normalizer.cause('Viral Infection  ') == 'Viral Infection'
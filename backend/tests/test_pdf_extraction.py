@@ -0,0 +1,94 @@
+import asyncio
+import io
+import PyPDF2
+import pytest
+from analysis_cache import AnalysisCache
+from pdf_extraction import PDFExtractor, scan_pages
+
+
+def form_pdf(text: str) -> bytes:
+    """One-page PDF whose content stream only draws form XObject /Fm1, which holds the text"""
+    form = f"BT /F1 11 Tf 50 750 Td ({text}) Tj ET".encode()
+    content = b"q /Fm1 Do Q"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /XObject << /Fm1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        b"<< /Type /XObject /Subtype /Form /BBox [0 0 612 792] /Resources << /Font << /F1 6 0 R >> >> "
+        b"/Length %d >>\nstream\n" % len(form) + form + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+@pytest.fixture
+def extractor(tmp_path):
+    extractor = PDFExtractor(workers=1, page_cache=AnalysisCache(str(tmp_path)))
+    yield extractor
+    extractor.shutdown()
+
+
+def test_page_digest_covers_form_xobjects():
+    alice = scan_pages(form_pdf("Patient Alice HIV positive"), 10)
+    bob = scan_pages(form_pdf("Patient Bob healthy"), 10)
+    assert alice != bob
+    assert scan_pages(form_pdf("Patient Alice HIV positive"), 10) == alice
+
+
+def test_shared_content_stream_does_not_leak_between_documents(extractor):
+    alice = asyncio.run(extractor.extract_text(form_pdf("Patient Alice HIV positive")))
+    bob = asyncio.run(extractor.extract_text(form_pdf("Patient Bob healthy")))
+    assert "Alice" in alice.text
+    assert "Bob" in bob.text
+    assert "Alice" not in bob.text
+
+
+def test_recovers_from_a_dead_worker(extractor):
+    async def run():
+        first = await extractor.extract_text(form_pdf("Patient Bob healthy"))
+        for process in extractor._executor._processes.values():
+            process.kill()
+        second = await extractor.extract_text(form_pdf("Patient Carol healthy"))
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert "Bob" in first.text
+    assert "Carol" in second.text
+
+
+def test_reports_truncated_documents(tmp_path):
+    extractor = PDFExtractor(workers=1, max_pages=1, page_cache=AnalysisCache(str(tmp_path)))
+    try:
+        short = asyncio.run(extractor.extract_text(form_pdf("Patient Bob healthy")))
+        pdf = PyPDF2.PdfWriter()
+        for _ in range(3):
+            pdf.add_page(PyPDF2.PdfReader(io.BytesIO(form_pdf("Patient Bob healthy"))).pages[0])
+        out = io.BytesIO()
+        pdf.write(out)
+        long = asyncio.run(extractor.extract_text(out.getvalue()))
+    finally:
+        extractor.shutdown()
+    assert (short.pages, short.total_pages, short.truncated) == (1, 1, False)
+    assert (long.pages, long.total_pages, long.truncated) == (1, 3, True)
+
+
+def test_page_digest_does_not_decode_streams(monkeypatch):
+    def decode(self):
+        raise AssertionError("stream decoded while hashing")
+
+    monkeypatch.setattr(PyPDF2.generic.EncodedStreamObject, 'get_data', decode)
+    monkeypatch.setattr(PyPDF2.generic.DecodedStreamObject, 'get_data', decode)
+    assert scan_pages(form_pdf("Patient Alice HIV positive"), 10)[1] == 1
@@ -0,0 +1,42 @@
+import prediction_cache
+from prediction_cache import PredictionCache, canonical_input
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_entries=2, ttl=60)
+    cache.put('v1', 'a', 1)
+    cache.put('v1', 'b', 2)
+    assert cache.get('v1', 'a') == 1
+    cache.put('v1', 'c', 3)
+    assert cache.get('v1', 'b') is None
+    assert (cache.get('v1', 'a'), cache.get('v1', 'c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, 'monotonic', lambda: now[0])
+    cache = PredictionCache(max_entries=10, ttl=60)
+    cache.put('v1', 'a', 1)
+    now[0] += 59
+    assert cache.get('v1', 'a') == 1
+    now[0] += 2
+    assert cache.get('v1', 'a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_new_model_version_drops_the_cache():
+    cache = PredictionCache()
+    cache.put('v1', 'a', 1)
+    assert cache.get('v2', 'a') is None
+    cache.put('v2', 'a', 2)
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['model_version'] == 'v2'
+
+
+def test_equivalent_inputs_share_a_key(core):
+    normalizer = core.get_normalizer()
+    key = canonical_input(normalizer, 30, 'M', 'Headache, Nausea', 'Stress')
+    assert canonical_input(normalizer, 30, 'M', ' nausea ,headache', 'stress') == key
+    assert canonical_input(normalizer, 31, 'M', 'Headache, Nausea', 'Stress') != key
+    assert canonical_input(normalizer, 30, 'M', 'Headache', 'Stress') != key
@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+import data_cleaner
+
+ROW = {'Age': 40, 'Gender': 'M', 'Symptoms': 'Fever, Cough', 'Causes': 'Viral Infection',
+       'Disease': 'Flu', 'Medicine': 'Paracetamol'}
+
+
+def test_transaction_commits_all_appends_or_none(store):
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.append([ROW, ROW])
+            raise RuntimeError("crash mid-upload")
+    assert store.last_id() == 0
+
+    with store.transaction():
+        store.append([ROW])
+        store.append([ROW, ROW])
+    assert len(list(store.iter_records())) == 3
+
+
+def test_failed_excel_upload_adds_no_records(store, tmp_path, monkeypatch):
+    path = tmp_path / 'upload.xlsx'
+    pd.DataFrame([ROW] * 5).to_excel(path, index=False)
+    clean = data_cleaner.clean_excel_data
+    calls = []
+
+    def clean_then_fail(chunk, date_formats):
+        calls.append(len(chunk))
+        if len(calls) == 3:
+            raise ValueError("bad chunk")
+        return clean(chunk, date_formats)
+
+    monkeypatch.setattr(data_cleaner, 'clean_excel_data', clean_then_fail)
+    with pytest.raises(ValueError):
+        data_cleaner.ingest_excel(str(path), store, chunksize=2)
+    assert store.last_id() == 0
+
+    monkeypatch.setattr(data_cleaner, 'clean_excel_data', clean)
+    assert data_cleaner.ingest_excel(str(path), store, chunksize=2)['records_added'] == 5
+    assert store.last_id() == 5
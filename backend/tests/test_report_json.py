@@ -0,0 +1,34 @@
+import json
+from report_json import JSONSectionScanner, extract_json_object
+
+ANALYSIS = {'summary': 'Normal {values}', 'findings': [{'emoji': '', 'text': 'Hb "ok"'}], 'terms': [],
+            'recommendations': []}
+
+
+def test_extract_skips_prose_and_unparsable_candidates():
+    text = 'Result [see below] {not json} then ' + json.dumps(ANALYSIS) + ' and {"later": 1}'
+    assert extract_json_object(text) == ANALYSIS
+
+
+def test_extract_ignores_braces_inside_strings():
+    assert extract_json_object('{"a": "}{", "b": "\\"}"}') == {'a': '}{', 'b': '"}'}
+
+
+def test_extract_finds_objects_inside_an_unclosed_brace():
+    assert extract_json_object('{ oops ' + json.dumps(ANALYSIS)) == ANALYSIS
+    assert extract_json_object('[1, 2] no object {') is None
+
+
+def test_extract_is_linear_in_unclosed_braces():
+    # Each unclosed { used to trigger a rescan of the rest of the text
+    assert extract_json_object('x{' * 20000 + '{"k": 1}') == {'k': 1}
+
+
+def test_scanner_yields_sections_across_chunks():
+    text = 'Here you go: ' + json.dumps(ANALYSIS) + ' trailing'
+    scanner = JSONSectionScanner()
+    sections = []
+    for i in range(0, len(text), 7):
+        sections.extend(scanner.feed(text[i:i + 7]))
+    assert sections == list(ANALYSIS.items())
+    assert json.loads(scanner.object_text()) == ANALYSIS
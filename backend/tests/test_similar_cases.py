@@ -0,0 +1,28 @@
+from dataset_cache import DatasetCache
+from similar_cases import CAUSE_WEIGHT, GENDER_WEIGHT, SimilarCaseIndex
+
+
+def record(symptoms, cause='Viral Infection', age=40, gender='M'):
+    return {'Age': age, 'Gender': gender, 'Symptoms': symptoms, 'Causes': cause,
+            'Disease': 'Flu', 'Medicine': 'Paracetamol'}
+
+
+def test_repeated_symptoms_count_once(tmp_path, store):
+    store.append([record('Fever, Fever, Cough'), record('Fever, Headache')])
+    index = SimilarCaseIndex(DatasetCache(store, str(tmp_path / 'dataset')))
+    index.refresh()
+
+    best, second = index.query('M', 'Fever, Cough', 'Viral Infection', k=2)
+    bonuses = CAUSE_WEIGHT + GENDER_WEIGHT
+    # {Fever, Cough} is the same symptom set as Fever, Fever, Cough
+    assert best == {'record_id': 1, 'score': round(1 + bonuses, 4)}
+    assert second == {'record_id': 2, 'score': round(1 / 3 + bonuses, 4)}
+
+
+def test_refresh_indexes_new_records_incrementally(tmp_path, store):
+    store.append([record('Cough')])
+    index = SimilarCaseIndex(DatasetCache(store, str(tmp_path / 'dataset')))
+    assert index.refresh() == 1
+    store.append([record('Rash, Rash', cause='Allergies')])
+    assert index.refresh() == 1
+    assert index.query('M', 'Rash', 'Allergies', k=1)[0]['record_id'] == 2
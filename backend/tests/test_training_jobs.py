@@ -0,0 +1,78 @@
+import os
+import asyncio
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+from conftest import synthetic_records
+from model_registry import ModelRegistry
+from training_jobs import TrainingScheduler
+
+
+class FakeRegistry:
+    """Stands in for ModelRegistry; publishing only records the version"""
+
+    def __init__(self):
+        self.version = 0
+        self.published = []
+
+    def source_version(self):
+        return self.version
+
+    def load_trained(self, model_version, source_version, data_digest=None):
+        self.published.append(model_version)
+        return SimpleNamespace(model_version=model_version)
+
+
+def test_requests_within_the_window_share_one_job():
+    registry = FakeRegistry()
+    scheduler = TrainingScheduler(registry, debounce_seconds=0.1, max_delay_seconds=0.3)
+    trainings = []
+
+    async def train():
+        trainings.append(registry.version)
+        return {'model_version': f'v{registry.version}', 'source_version': registry.version}
+
+    scheduler._train = train
+
+    async def run():
+        first = scheduler.request_retrain()
+        # Each upload pushes the deadline back, but never past max_delay_seconds
+        while first.status == 'pending':
+            await asyncio.sleep(0.02)
+            registry.version += 1
+            job = scheduler.request_retrain()
+        await asyncio.gather(*scheduler._tasks)
+        return first, job
+
+    first, second = asyncio.run(run())
+    assert first.requests > 1
+    assert 0.3 <= first.started_at - first.created_at < 0.5
+    # Requests after the job started form the next one
+    assert second is not first
+    assert [first.status, second.status] == ['succeeded', 'succeeded']
+    assert len(trainings) == 2
+    assert registry.published == [first.model_version, second.model_version]
+
+
+def test_replaces_a_dead_training_worker(tmp_path, store, monkeypatch):
+    # Read by the spawned worker, which then trains the fast incremental models
+    monkeypatch.setenv('TRAINING_MODE', 'incremental')
+    store.append(synthetic_records(40))
+    registry = ModelRegistry(store, str(tmp_path / 'artifacts'), str(tmp_path / 'dataset'), evaluate=False)
+    scheduler = TrainingScheduler(registry)
+
+    async def run():
+        executor = scheduler._get_executor()
+        await asyncio.get_running_loop().run_in_executor(executor, os.getpid)
+        for process in executor._processes.values():
+            process.kill()
+        trained = await scheduler._train()
+        return executor, trained
+
+    try:
+        dead, trained = asyncio.run(run())
+        assert isinstance(scheduler._executor, ProcessPoolExecutor)
+        assert scheduler._executor is not dead
+        assert trained['source_version'] == 40
+        assert registry.load_trained(**trained).model_version == trained['model_version']
+    finally:
+        scheduler.shutdown()
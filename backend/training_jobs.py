@@ -0,0 +1,193 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from model_registry import ModelRegistry
+from record_store import RecordStore
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = float(os.getenv('RETRAIN_DEBOUNCE_SECONDS', '5'))
+MAX_DELAY_SECONDS = float(os.getenv('RETRAIN_MAX_DELAY_SECONDS', '60'))
+MAX_JOB_HISTORY = 50
+
+
+def train_models(store_path: str, artifact_dir: Optional[str], dataset_dir: str) -> Dict[str, Any]:
+    """Fit both predictors in a worker process and persist them as artifacts.
+
+    Returns what the server needs to load exactly these models: their
+    version, the record store version and the digest of the data they were
+    trained on.
+    """
+    # The spawned worker doesn't inherit the server's logging setup
+    logging.basicConfig(level=logging.INFO)
+    # The server evaluates the models once it has published them
+    registry = ModelRegistry(RecordStore(store_path), artifact_dir, dataset_dir, evaluate=False)
+    snapshot = registry.load()
+    return {
+        'model_version': snapshot.model_version,
+        'source_version': snapshot.source_version,
+        'data_digest': snapshot.dataset.data_digest.hex() if snapshot.dataset is not None else None
+    }
+
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, tz=timezone.utc).isoformat()
+
+
+class TrainingJob:
+    """One retrain of the predictors, possibly covering several uploads"""
+
+    def __init__(self, deadline: float, latest_deadline: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.status = 'pending'
+        self.requests = 1
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.model_version: Optional[str] = None
+        self.error: Optional[str] = None
+        self.deadline = deadline
+        self.latest_deadline = latest_deadline
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'requests': self.requests,
+            'created_at': _timestamp(self.created_at),
+            'started_at': _timestamp(self.started_at),
+            'finished_at': _timestamp(self.finished_at),
+            'model_version': self.model_version,
+            'error': self.error
+        }
+
+
+class TrainingScheduler:
+    """Debounced background retraining of the registry's predictors.
+
+    Retrain requests arriving within the debounce window are folded into one
+    pending job. Training runs in a separate process so it never holds the
+    event loop or the GIL, and the registry only publishes the new models
+    once that process has trained and saved them successfully.
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, registry: ModelRegistry, debounce_seconds: float = DEBOUNCE_SECONDS,
+                 max_delay_seconds: float = MAX_DELAY_SECONDS):
+        self.registry = registry
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.jobs: 'OrderedDict[str, TrainingJob]' = OrderedDict()
+        self._pending: Optional[TrainingJob] = None
+        self._scheduled_version: Optional[int] = None
+        self._run_lock: Optional[asyncio.Lock] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks = set()
+
+    def request_retrain(self) -> TrainingJob:
+        """Schedule a retrain, merging it into the pending job if there is one"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._scheduled_version = self.registry.source_version()
+
+        job = self._pending
+        if job is not None:
+            job.requests += 1
+            job.deadline = min(now + self.debounce_seconds, job.latest_deadline)
+            return job
+
+        job = TrainingJob(now + self.debounce_seconds, now + self.max_delay_seconds)
+        self._pending = job
+        self.jobs[job.id] = job
+        while len(self.jobs) > MAX_JOB_HISTORY:
+            self.jobs.popitem(last=False)
+
+        task = loop.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def notify_source_changed(self) -> None:
+        """Registry hook: retrain when records were added outside an upload"""
+        if self.registry.source_version() != self._scheduled_version:
+            self.request_retrain()
+
+    def get(self, job_id: str) -> Optional[TrainingJob]:
+        return self.jobs.get(job_id)
+
+    def recent_jobs(self) -> List[TrainingJob]:
+        return list(reversed(self.jobs.values()))
+
+    async def _run(self, job: TrainingJob) -> None:
+        loop = asyncio.get_running_loop()
+        while (delay := job.deadline - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+        if self._run_lock is None:
+            self._run_lock = asyncio.Lock()
+        async with self._run_lock:
+            # From here on new uploads start a fresh job instead of joining this one
+            if self._pending is job:
+                self._pending = None
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                with timed('retrain_job'):
+                    trained = await self._train()
+                # Publish the version the worker saved; records that arrived
+                # while it trained are picked up by the next job
+                snapshot = await asyncio.to_thread(self.registry.load_trained, **trained)
+                job.model_version = snapshot.model_version
+                job.status = 'succeeded'
+                logger.info(f"Training job {job.id} published model {job.model_version}")
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                logger.error(f"Training job {job.id} failed: {str(e)}")
+            finally:
+                job.finished_at = time.time()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn avoids forking a process that already runs server threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    async def _train(self) -> Dict[str, Any]:
+        """Run train_models in the worker, replacing the pool once if the worker died"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(
+                    executor, train_models, self.registry.store.path,
+                    self.registry.artifact_dir, self.registry.dataset_cache.directory
+                )
+            except BrokenProcessPool:
+                # A dead worker breaks the pool for good; later jobs need a new one
+                if self._executor is executor:
+                    self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                if attempt:
+                    raise
+                logger.warning("Training worker died, restarting it")
+
+    def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None